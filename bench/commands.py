@@ -0,0 +1,372 @@
+# Offline benchmark for the DinoTracker and Settings cogs.
+#
+# Seeds an SQLite database (10k users / 1M records by default), loads the
+# cogs into a bot that never connects to Discord, and drives each command
+# flow through stub interactions. Reports per-interaction p50/p99 latency
+# plus SQL statements and REST calls per flow.
+#
+#   python -m bench.commands [--users N] [--records N] [--iterations N]
+#                            [--concurrency N] [--db PATH] [--reseed]
+#                            [--storage sqlite|memory]
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+import discord
+from discord.ext import commands
+
+from cogs.dino_tracker import CATALOG_PATH
+from utils.catalog import load_catalog_config, sync_catalog
+from utils.database import Database
+from utils.dispatcher import InteractionDispatcher
+from utils.events import EventBus
+from utils.memory_storage import MemoryStorage
+from utils.metrics import metrics
+from utils.outbound import OutboundScheduler
+from utils.schema import migrate
+from utils.storage import SQLiteStorage
+
+CATALOG = load_catalog_config(CATALOG_PATH)
+GAME_MODES, SERVERS_BY_MODE = CATALOG.game_modes, CATALOG.servers_by_mode
+DINOSAURS, GENDERS = CATALOG.dinosaurs, CATALOG.genders
+
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA')
+
+
+class Counters:
+    def __init__(self):
+        self.queries = 0
+        self.rest = 0
+        self._lock = threading.Lock()
+
+    def query(self, sql: str):
+        if sql.lstrip().upper().startswith(TRANSACTION_CONTROL):
+            return
+        with self._lock:
+            self.queries += 1
+
+    def snapshot(self):
+        return self.queries, self.rest
+
+
+class TracedDatabase(Database):
+    # Counts every SQL statement run on any of its connections
+    def __init__(self, path: str, counters: Counters, **kwargs):
+        super().__init__(path, **kwargs)
+        self.counters = counters
+
+    def _writer_connection(self):
+        traced = self._writer is not None
+        conn = super()._writer_connection()
+        if not traced:
+            conn.set_trace_callback(self.counters.query)
+        return conn
+
+    def _reader_connection(self):
+        traced = getattr(self._local, 'conn', None) is not None
+        conn = super()._reader_connection()
+        if not traced:
+            conn.set_trace_callback(self.counters.query)
+        return conn
+
+
+class StubResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _call(self):
+        self._interaction.counters.rest += 1
+        self._done = True
+
+    async def send_message(self, *args, **kwargs):
+        self._interaction.sent = kwargs.get('view')
+        await self._call()
+
+    async def edit_message(self, *args, **kwargs):
+        await self._call()
+
+    async def defer(self, *args, **kwargs):
+        await self._call()
+
+    async def send_modal(self, modal, **kwargs):
+        self._interaction.sent = modal
+        await self._call()
+
+
+class StubFollowup:
+    def __init__(self, counters: Counters):
+        self.counters = counters
+
+    async def send(self, *args, **kwargs):
+        self.counters.rest += 1
+
+
+class StubInteraction:
+    # Just enough of discord.Interaction for the cogs and the dispatcher
+    def __init__(self, counters: Counters, user_id: int, custom_id: str = None, values=None, fields=None):
+        self.counters = counters
+        self.id = id(self)
+        self.user = discord.Object(id=user_id)
+        self.message = None
+        self.channel = discord.Object(id=1)
+        self.type = discord.InteractionType.component if custom_id else discord.InteractionType.application_command
+        self.data = {'custom_id': custom_id, 'values': values or []}
+        if fields is not None:
+            self.type = discord.InteractionType.modal_submit
+            self.data['components'] = [
+                {'type': 1, 'components': [{'type': 4, 'custom_id': key, 'value': value}]}
+                for key, value in fields.items()
+            ]
+        self.response = StubResponse(self)
+        self.followup = StubFollowup(counters)
+        self.sent = None
+
+    async def delete_original_response(self):
+        self.counters.rest += 1
+
+    async def edit_original_response(self, *args, **kwargs):
+        self.counters.rest += 1
+
+
+def plan(catalog, users: int, records: int):
+    # One record per (user, account, server); users get as many alt accounts
+    # as it takes to hold their share of the records. Returns the account
+    # names and a generator of (user, account, server_id, dinosaur_id,
+    # gender_id, is_nested).
+    server_ids = list(catalog.servers)
+    dinosaur_ids = list(catalog.dinosaur_ids.values())
+    gender_ids = list(catalog.gender_ids.values())
+    per_user = -(-records // users)
+    accounts = -(-per_user // len(server_ids))
+    names = ['main'] + [f'alt{i}' for i in range(1, accounts)]
+    rng = random.Random(0)
+
+    def rows():
+        made = 0
+        for user in range(1, users + 1):
+            for slot in range(per_user):
+                if made == records:
+                    return
+                made += 1
+                yield (user, names[slot // len(server_ids)], server_ids[slot % len(server_ids)],
+                       rng.choice(dinosaur_ids), rng.choice(gender_ids), rng.randint(0, 1))
+
+    return names, rows()
+
+
+def seed(path: str, users: int, records: int):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    migrate(conn)
+    conn.execute('BEGIN')
+    catalog = sync_catalog(conn, GAME_MODES, SERVERS_BY_MODE, DINOSAURS, GENDERS)
+    names, rows = plan(catalog, users, records)
+    conn.executemany('INSERT INTO account_names (name) VALUES (?)', [(name,) for name in names])
+    account_ids = dict(conn.execute('SELECT name, id FROM account_names'))
+    if len(names) > 1:
+        conn.executemany('''
+            INSERT INTO user_settings (discord_id, alt_accounts_enabled, num_alt_accounts) VALUES (?, 1, ?)
+        ''', [(user, len(names) - 1) for user in range(1, users + 1)])
+        conn.executemany('INSERT INTO alt_accounts (discord_id, account_name) VALUES (?, ?)', [
+            (user, name) for user in range(1, users + 1) for name in names[1:]
+        ])
+
+    rng = random.Random(0)
+    now = datetime.now()
+    conn.executemany('''
+        INSERT INTO dino_records
+        (discord_id, account_id, server_id, dinosaur_id, gender_id, is_nested, date_updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        (user, account_ids[name], *rest, now - timedelta(seconds=rng.randint(0, 12 * 3600)))
+        for user, name, *rest in rows
+    ))
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+async def seed_memory(storage, users: int, records: int):
+    catalog = await storage.sync_catalog(GAME_MODES, SERVERS_BY_MODE, DINOSAURS, GENDERS)
+    names, rows = plan(catalog, users, records)
+    if len(names) > 1:
+        for user in range(1, users + 1):
+            await storage.set_alt_accounts_enabled(user, True)
+            await storage.set_num_alt_accounts(user, len(names) - 1)
+            for name in names[1:]:
+                await storage.add_alt_account(user, name)
+    for row in rows:
+        await storage.save_record(*row)
+
+
+class Bench:
+    def __init__(self, bot, counters: Counters, users: int):
+        self.bot = bot
+        self.counters = counters
+        self.users = users
+        self.tracker = bot.get_cog('DinoTracker')
+        self.settings = bot.get_cog('Settings')
+        self.dispatcher = bot.interaction_dispatcher
+        self.latencies = []
+        self.rng = random.Random(1)
+
+    async def timed(self, coro):
+        start = time.perf_counter()
+        await coro
+        self.latencies.append(time.perf_counter() - start)
+
+    async def command(self, command, user_id: int, *args):
+        interaction = StubInteraction(self.counters, user_id)
+        await self.timed(command.callback(command.binding, interaction, *args))
+        return interaction
+
+    async def update_dino(self, user_id: int):
+        interaction = await self.command(self.tracker.update_dino, user_id)
+        accounts = await self.tracker.get_accounts(user_id)
+        game_mode = self.rng.choice(GAME_MODES)
+        region = self.rng.choice(list(SERVERS_BY_MODE[game_mode]))
+        dino_type = self.rng.choice(list(DINOSAURS))
+        steps = [('place', CATALOG.place(game_mode, region)),
+                 ('server', self.rng.choice(SERVERS_BY_MODE[game_mode][region])),
+                 ('dinosaur', self.rng.choice(DINOSAURS[dino_type])),
+                 (f'nested:{self.rng.choice(GENDERS)}', None)]
+        if len(accounts) > 1:
+            steps.insert(0, ('account', self.rng.choice(accounts)))
+        for action, value in steps:
+            await self.click_action(user_id, interaction, action, value)
+
+    async def server_info(self, user_id: int):
+        interaction = await self.command(self.tracker.server_info, user_id)
+        game_mode = self.rng.choice(GAME_MODES)
+        await self.click_action(user_id, interaction, 'mode', game_mode)
+        await self.click_action(user_id, interaction, 'region', self.rng.choice(list(SERVERS_BY_MODE[game_mode])))
+
+    async def my_dinos(self, user_id: int):
+        interaction = await self.command(self.tracker.my_dinos, user_id)
+        accounts = await self.tracker.get_accounts(user_id)
+        await self.click_action(user_id, interaction, 'account', self.rng.choice(accounts))
+        for _ in range(3):
+            await self.click_action(user_id, interaction, 'next')
+        await self.click_action(user_id, interaction, 'previous')
+        await self.click_action(user_id, interaction, 'done')
+
+    async def settings_flow(self, user_id: int):
+        # Re-submit the alt setup modal with the names it is pre-filled with
+        interaction = await self.command(self.settings.toggle_alt_accounts, user_id, True)
+        modal = interaction.sent
+        await self.timed(self.dispatcher.dispatch(StubInteraction(
+            self.counters, user_id, modal.custom_id, fields={'names': modal.children[0].default or 'alt1'}
+        )))
+        await self.command(self.settings.list_alts, user_id)
+        await self.command(self.settings.name_alt, user_id, 1, f'alt{self.rng.randint(1, 10)}')
+
+    async def click_action(self, user_id: int, interaction, action: str, value=None):
+        session_id = self._session_id(interaction)
+        kind = self._kind(interaction)
+        custom_id = f'dino:{kind}:{session_id}:{action}'
+        await self.timed(self.dispatcher.dispatch(
+            StubInteraction(self.counters, user_id, custom_id, [value] if value is not None else [])
+        ))
+
+    @staticmethod
+    def _session_id(interaction) -> str:
+        return interaction.sent.children[0].custom_id.split(':')[2]
+
+    @staticmethod
+    def _kind(interaction) -> str:
+        return interaction.sent.children[0].custom_id.split(':')[1]
+
+    async def run(self, name: str, flow, iterations: int, concurrency: int):
+        self.latencies = []
+        queries, rest = self.counters.snapshot()
+        start = time.perf_counter()
+        remaining = iter(range(iterations))
+
+        async def worker():
+            for _ in remaining:
+                await flow(self.rng.randint(1, self.users))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        queries = self.counters.queries - queries
+        rest = self.counters.rest - rest
+
+        latencies = sorted(self.latencies)
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f'{name:<14}{iterations:>8}{len(latencies):>10}{p50:>10.2f}{p99:>10.2f}'
+              f'{queries / iterations:>10.1f}{rest / iterations:>10.1f}{iterations / elapsed:>10.1f}')
+
+
+async def main(args):
+    memory = args.storage == 'memory'
+    if not memory and (args.reseed or not os.path.exists(args.db)):
+        print(f'Seeding {args.db} with {args.users} users / {args.records} records...')
+        start = time.perf_counter()
+        seed(args.db, args.users, args.records)
+        print(f'Seeded in {time.perf_counter() - start:.1f}s')
+
+    counters = Counters()
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.default())
+    # In memory mode only UI sessions go through SQLite (an in-memory one)
+    bot.db = TracedDatabase(':memory:' if memory else args.db, counters)
+    bot.interaction_dispatcher = InteractionDispatcher(bot.db)
+    bot.outbound = OutboundScheduler()
+    bot.events = EventBus(bot.db)
+    bot.storage = MemoryStorage() if memory else SQLiteStorage(bot.db)
+    bot.primary = True
+    # What login() would do: bind the client to this loop so bot.dispatch works
+    await bot._async_setup_hook()
+    bot.outbound.start()
+    await bot.db.connect()
+    await bot.db.run(migrate)
+    if memory:
+        print(f'Seeding memory storage with {args.users} users / {args.records} records...')
+        start = time.perf_counter()
+        await seed_memory(bot.storage, args.users, args.records)
+        print(f'Seeded in {time.perf_counter() - start:.1f}s')
+    await bot.load_extension('cogs.dino_tracker')
+    await bot.load_extension('cogs.settings_alt_accounts')
+    # Background tasks would only add noise to the measurements
+    tracker = bot.get_cog('DinoTracker')
+    for loop in (tracker.expire_stale_records, tracker.sample_population, tracker.watch_catalog):
+        loop.cancel()
+
+    bench = Bench(bot, counters, args.users)
+    print(f'{"flow":<14}{"runs":>8}{"requests":>10}{"p50 ms":>10}{"p99 ms":>10}'
+          f'{"sql/run":>10}{"rest/run":>10}{"runs/s":>10}')
+    for name, flow in (('update_dino', bench.update_dino), ('server_info', bench.server_info),
+                       ('my_dinos', bench.my_dinos), ('settings', bench.settings_flow)):
+        await bench.run(name, flow, args.iterations, args.concurrency)
+    for name, cache in sorted(metrics.caches.items()):
+        print(f'{name} cache: {cache.hits} hits, {cache.misses} misses')
+
+    await bot.outbound.stop()
+    await bot.close()
+    await bot.db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark for the bot cogs')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--db', default='bench.db')
+    parser.add_argument('--reseed', action='store_true')
+    parser.add_argument('--storage', choices=('sqlite', 'memory'), default='sqlite')
+    asyncio.run(main(parser.parse_args()))
@@ -1,29 +1,126 @@
 import discord
 from discord.ext import commands
-from discord import app_commands
+import asyncio
+import hashlib
+import json
 import os
+import time
 from dotenv import load_dotenv
 
+from utils.checks import is_owner
+from utils.database import Database
+from utils.dispatcher import InteractionDispatcher
+from utils.events import EventBus
+from utils.memory_storage import MemoryStorage
+from utils.metrics import InstrumentedCommandTree, metrics, start_metrics_server
+from utils.outbound import OutboundScheduler
+from utils.schema import MIGRATIONS, incremental_vacuum_enabled, migrate, schema_version
+from utils.storage import SQLiteStorage
+
 load_dotenv()
 TOKEN = os.getenv('DISCORD_BOT_TOKEN') 
 SIK_ID = int(os.getenv('SIK_ID'))
+# STORAGE=memory keeps everything in memory: fast, but lost on restart
+STORAGE = os.getenv('STORAGE', 'sqlite')
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'dino_tracker.db') if STORAGE != 'memory' else ':memory:'
+DB_READERS = int(os.getenv('DB_READERS', '4'))
+DB_WRITE_WINDOW_MS = float(os.getenv('DB_WRITE_WINDOW_MS', '2'))
+DB_WRITE_BATCH = int(os.getenv('DB_WRITE_BATCH', '128'))
+# Prometheus text endpoint for the metrics; disabled unless a port is set
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Sharding: SHARDED=1 runs every shard in this process with AutoShardedBot;
+# launcher.py instead sets SHARD_COUNT/SHARD_IDS and CLUSTER_ID/CLUSTER_COUNT
+# to run a slice of the shards in each of several processes.
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS', '').split(',') if shard.strip()] or None
+SHARDED = os.getenv('SHARDED', '0') == '1' or SHARD_COUNT is not None
+CLUSTER_ID = int(os.getenv('CLUSTER_ID', '0'))
+CLUSTER_COUNT = int(os.getenv('CLUSTER_COUNT', '1'))
+EVENT_POLL_SECONDS = float(os.getenv('EVENT_POLL_SECONDS', '1'))
+# How long other clusters wait for the primary to bring the schema up to date
+SCHEMA_WAIT_SECONDS = float(os.getenv('SCHEMA_WAIT_SECONDS', '600'))
+# Everything the bot does arrives as interactions, so the lean profile only
+# subscribes to guild events and keeps no message or member caches.
+# GATEWAY_PROFILE=default restores discord.py's default intents and caches.
+GATEWAY_PROFILE = os.getenv('GATEWAY_PROFILE', 'lean')
 
-def is_owner():
-    async def predicate(interaction: discord.Interaction):
-        return await interaction.client.is_owner(interaction.user)
-    return app_commands.check(predicate)
+class DinoCommandTree(InstrumentedCommandTree):
+    # Running a command (and answering it) keeps queued cleanup waiting
+    async def _call(self, interaction: discord.Interaction):
+        with self.client.outbound.user_activity():
+            await super()._call(interaction)
 
-class DinoBot(commands.Bot):
+class DinoBot(commands.AutoShardedBot if SHARDED else commands.Bot):
     def __init__(self):
-        intents = discord.Intents.default()
-        intents.message_content = True
-        super().__init__(command_prefix='!', intents=intents)
+        options = {}
+        if GATEWAY_PROFILE == 'lean':
+            intents = discord.Intents.none()
+            intents.guilds = True
+            options.update(
+                max_messages=None,
+                chunk_guilds_at_startup=False,
+                member_cache_flags=discord.MemberCacheFlags.none()
+            )
+        else:
+            intents = discord.Intents.default()
+        if SHARDED:
+            options.update(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+        super().__init__(
+            command_prefix='!',
+            intents=intents,
+            tree_cls=DinoCommandTree,
+            http_trace=metrics.http_trace(),
+            **options
+        )
+        # The first cluster owns the once-per-deployment work: command sync,
+        # schema upkeep and the background maintenance tasks
+        self.primary = CLUSTER_ID == 0
+        # Single connection manager shared by every cog
+        self.db = Database(
+            DATABASE_PATH,
+            readers=DB_READERS,
+            batch_window=DB_WRITE_WINDOW_MS / 1000,
+            max_batch=DB_WRITE_BATCH
+        )
+        # Routes component clicks to their stored UI session by custom_id
+        self.interaction_dispatcher = InteractionDispatcher(self.db)
+        self.metrics_runner = None
+        # Followups and cleanup deletes go through here so cleanup waits for idle time
+        self.outbound = OutboundScheduler()
+        # Tells the other processes sharing the database what to re-read
+        self.events = EventBus(self.db, enabled=CLUSTER_COUNT > 1 and STORAGE != 'memory',
+                               poll_interval=EVENT_POLL_SECONDS, prune=self.primary)
+        # Records, settings and population data, behind the Storage interface
+        self.storage = MemoryStorage() if STORAGE == 'memory' else SQLiteStorage(self.db, self.events)
 
     async def setup_hook(self):
         print("Setting up bot...")
         try:
+            await self.db.connect()
+            if self.primary:
+                version = await self.db.run(migrate)
+            else:
+                version = await self.wait_for_schema()
+            print(f"Database schema at version {version}")
+            if self.primary and STORAGE != 'memory' and not await self.db.run(incremental_vacuum_enabled):
+                # Switching an existing database over needs a full VACUUM,
+                # which is too slow to hold up startup; it is done offline
+                print("Incremental vacuum is off, so archived space isn't returned to the OS. "
+                      "Stop the bot and run: python -m utils.schema enable-incremental-vacuum")
+            if self.primary:
+                self.interaction_dispatcher.start()
+            self.outbound.start()
+            await self.events.start()
+            if METRICS_PORT:
+                # One port per cluster, counting up from METRICS_PORT
+                port = METRICS_PORT + CLUSTER_ID
+                self.metrics_runner = await start_metrics_server(METRICS_HOST, port)
+                print(f"Serving metrics on http://{METRICS_HOST}:{port}/metrics")
+
             # Load cogs first
             cogs_folder = './cogs'
+            failed = []
             if os.path.exists(cogs_folder) and os.path.isdir(cogs_folder):
                 for filename in os.listdir(cogs_folder):
                     if filename.endswith('.py'):
@@ -32,20 +129,85 @@ class DinoBot(commands.Bot):
                             print(f'✓ Loaded extension: {filename[:-3]}')
                         except Exception as e:
                             print(f'✗ Failed to load extension {filename[:-3]}: {e}')
+                            failed.append(filename[:-3])
             else:
                 print('No cogs folder found. Skipping cog loading.')
+            if failed:
+                raise RuntimeError(f"failed to load {', '.join(failed)}")
             
-            # Sync commands globally
-            print("Syncing commands globally...")
-            synced = await self.tree.sync()
-            print(f"Successfully synced {len(synced)} commands globally")
+            # Sync commands globally, but only if they changed since the last sync
+            if self.primary:
+                synced = await self.sync_commands()
+                if synced is None:
+                    print("Commands unchanged since last sync. Skipping global sync.")
+                else:
+                    print(f"Successfully synced {len(synced)} commands globally")
             
         except Exception as e:
+            # Exit rather than run without cogs, so launcher.py (or whatever
+            # supervises the process) restarts it
             print(f"Error during setup: {str(e)}")
+            raise
+
+    async def wait_for_schema(self) -> int:
+        # Only the primary migrates. A migration that rewrites a big table
+        # holds the write lock far longer than busy_timeout, so the other
+        # clusters wait for it to finish instead of racing it for the lock.
+        deadline = time.monotonic() + SCHEMA_WAIT_SECONDS
+        waiting = False
+        while True:
+            version = await self.db.run(schema_version)
+            if version >= len(MIGRATIONS):
+                return version
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"database schema still at version {version} after {SCHEMA_WAIT_SECONDS:g}s")
+            if not waiting:
+                print(f"Waiting for the primary cluster to migrate the database (at version {version})")
+                waiting = True
+            await asyncio.sleep(1)
+
+    def command_tree_hash(self) -> str:
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        payload.sort(key=lambda command: (command.get('type', 1), command['name']))
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_commands(self, force: bool = False):
+        # Returns the synced commands, or None when the tree matches the hash
+        # stored at the last successful sync and force is not set.
+        key = f'command_tree_hash:{self.application_id}'
+        tree_hash = self.command_tree_hash()
+        if not force:
+            row = await self.db.fetchone('SELECT value FROM bot_meta WHERE key = ?', (key,))
+            if row and row[0] == tree_hash:
+                return None
+
+        print("Syncing commands globally...")
+        synced = await self.tree.sync()
+        await self.db.execute('''
+            INSERT INTO bot_meta (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        ''', (key, tree_hash))
+        return synced
+
+    async def close(self):
+        self.interaction_dispatcher.stop()
+        self.events.stop()
+        await self.outbound.stop()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await super().close()
+        await self.db.close()
+
+    async def on_interaction(self, interaction: discord.Interaction):
+        # Menu clicks answer with message edits; they count as activity too
+        with self.outbound.user_activity():
+            await self.interaction_dispatcher.dispatch(interaction)
 
     async def on_ready(self):
         print(f'\n{self.user.name} is now online!')
         print(f'Bot ID: {self.user.id}')
+        if SHARDED:
+            print(f'Cluster {CLUSTER_ID}: shards {self.shard_ids} of {self.shard_count}')
         print("\nRegistered commands:")
         for command in self.tree.get_commands():
             print(f"- {command.name}")
@@ -75,7 +237,7 @@ async def sync(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     try:
         print("Manually syncing commands...")
-        synced = await bot.tree.sync()
+        synced = await bot.sync_commands(force=True)
         await interaction.followup.send(
             f"Successfully synced {len(synced)} commands globally ✓",
             ephemeral=True
@@ -86,6 +248,38 @@ async def sync(interaction: discord.Interaction):
             ephemeral=True
         )
 
+@bot.tree.command(name="stats", description="Show command latency and REST statistics (Owner only)")
+@is_owner()
+async def stats(interaction: discord.Interaction):
+    embed = discord.Embed(title="Bot Statistics", color=discord.Color.blue())
+    uptime = int(time.time() - metrics.started)
+    embed.description = (
+        f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m\n"
+        f"REST calls: {metrics.rest_calls} ({metrics.ratelimits} rate limited)"
+    )
+    for name, cache in sorted(metrics.caches.items()):
+        lookups = cache.hits + cache.misses
+        embed.description += (
+            f"\n{name.capitalize()} cache: {cache.hits}/{lookups} hits"
+            f" ({cache.hits / lookups if lookups else 0:.0%}), {len(cache)} entries"
+        )
+
+    # Slowest operations first; p50/p99 are histogram bucket upper bounds
+    operations = sorted(metrics.operations.items(), key=lambda item: item[1].wall.quantile(0.99), reverse=True)
+    for name, op in operations[:25]:
+        embed.add_field(
+            name=f"{name} ({op.wall.count}x)",
+            value=(
+                f"p50 {op.wall.quantile(0.5):g}ms, p99 {op.wall.quantile(0.99):g}ms\n"
+                f"db p99 {op.db.quantile(0.99):g}ms, REST {op.rest_calls / op.wall.count:.1f}/op\n"
+                f"429s {op.ratelimits} ({op.ratelimit_wait:.1f}s), errors {op.errors}"
+            ),
+            inline=True
+        )
+    if not operations:
+        embed.add_field(name="No data", value="Nothing recorded yet", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.errors.CommandNotFound):
@@ -98,5 +292,7 @@ if __name__ == "__main__":
         bot.run(TOKEN)
     except discord.errors.LoginFailure:
         print("Error: Invalid bot token")
+        raise SystemExit(1)
     except Exception as e:
-        print(f"Error starting bot: {str(e)}")
\ No newline at end of file
+        print(f"Error starting bot: {str(e)}")
+        raise SystemExit(1)
\ No newline at end of file
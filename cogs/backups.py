@@ -0,0 +1,86 @@
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+import asyncio
+import os
+import time
+
+from utils.backup import prune_backups, snapshot_database
+from utils.checks import is_owner
+
+# Compressed snapshots of the database go to BACKUP_DIR; the newest
+# BACKUP_KEEP are kept. BACKUP_INTERVAL_HOURS=0 turns off scheduled backups.
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+# Pages copied per backup step and the pause between steps
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', '1024'))
+BACKUP_STEP_DELAY_MS = float(os.getenv('BACKUP_STEP_DELAY_MS', '5'))
+
+class Backups(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        # Nothing to back up with STORAGE=memory
+        return self.bot.db.path != ':memory:'
+
+    async def cog_load(self):
+        # Scheduled backups only need to run in one process
+        if self.enabled and self.bot.primary and BACKUP_INTERVAL_HOURS > 0:
+            self.scheduled_backup.change_interval(hours=BACKUP_INTERVAL_HOURS)
+            self.scheduled_backup.start()
+
+    async def cog_unload(self):
+        self.scheduled_backup.cancel()
+
+    async def run_backup(self):
+        # The copy and compression run in a worker thread, so commands keep
+        # being served while they do
+        async with self.lock:
+            start = time.perf_counter()
+            path = await asyncio.to_thread(
+                snapshot_database, self.bot.db.path, BACKUP_DIR, BACKUP_STEP_PAGES, BACKUP_STEP_DELAY_MS / 1000
+            )
+            removed = await asyncio.to_thread(prune_backups, self.bot.db.path, BACKUP_DIR, BACKUP_KEEP)
+            return path, os.path.getsize(path), time.perf_counter() - start, removed
+
+    @tasks.loop(hours=24)
+    async def scheduled_backup(self):
+        # The loop's first run is at startup; skip it so restarts don't
+        # each take a backup
+        if self.scheduled_backup.current_loop == 0:
+            return
+        try:
+            path, size, seconds, removed = await self.run_backup()
+            print(f"Backed up database to {path} ({size / 1e6:.1f} MB in {seconds:.1f}s, "
+                  f"{len(removed)} old backup(s) removed)")
+        except Exception as e:
+            print(f"Error backing up database: {e}")
+
+    @app_commands.command(name="backup", description="Back up the database now (Owner only)")
+    @is_owner()
+    async def backup(self, interaction: discord.Interaction):
+        if not self.enabled:
+            await interaction.response.send_message("The bot is running without a database file; nothing to back up.", ephemeral=True)
+            return
+        if self.lock.locked():
+            await interaction.response.send_message("A backup is already running.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            path, size, seconds, removed = await self.run_backup()
+        except Exception as e:
+            await interaction.followup.send(f"Backup failed: {e}", ephemeral=True)
+            return
+        await interaction.followup.send(
+            f"Backed up the database to `{path}` ({size / 1e6:.1f} MB compressed, {seconds:.1f}s); "
+            f"{len(removed)} old backup(s) removed ✓",
+            ephemeral=True
+        )
+
+async def setup(bot):
+    await bot.add_cog(Backups(bot))
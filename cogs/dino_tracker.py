@@ -1,448 +1,640 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
-import sqlite3
+from discord.ext import commands, tasks
 import asyncio
-from datetime import datetime
+import os
+import time
+from datetime import datetime, timedelta
+from functools import partial
 from typing import Optional, List
 
-GENDERS = ["Male", "Female"]
-
-GAME_MODES = ["Hordetest", "Evrima Public Branch"]
-
-SERVERS_BY_MODE = {
-    "Hordetest": {
-        "Americas": ["NA 1 - West", "NA 2 - West No AI", "NA 3 - East", "NA 4 - East"],
-        "Europe": ["EU 1 - West", "EU 2 - Central", "EU 3 - Central No AI", "EU 4 - Central"],
-    },
-    "Evrima Public Branch": {
-        "Americas": ["NA 2 - West", "NA 3 - West", "NA 4 - East", "NA 5- East", "CA 1 - Central", "SA 1 - East", "SA 2 - East"],
-        "Europe": ["EU 1 - West", "EU 2 - West", "EU 3 - West", "EU 4 - Central", "EU 5 - North", "EU 6 - South", "EU 7 - South"],
-        "Asia": ["AS 1 - South East", "AS 2 - South", "AS 3 - East"],
-        "Australia": ["AU 1 - East", "AU 2 - East"]
-    }
+from utils.accounts import AccountCache
+from utils.catalog import MAX_OPTIONS, CatalogConfig, CatalogError, load_catalog_config
+from utils.checks import is_owner
+from utils.dispatcher import Session
+from utils.metrics import metrics
+from utils.population import PopulationCache
+from utils.render_cache import RenderCache
+from utils.search import SearchIndex
+
+# Only records updated within this window count towards server population;
+# older ones are moved to the archive by a background task. Archived records
+# still show in /my_dinos until they go ARCHIVE_RETENTION_DAYS without an
+# update, when they are deleted.
+POPULATION_WINDOW_HOURS = float(os.getenv('POPULATION_WINDOW_HOURS', '24'))
+ARCHIVE_RETENTION_DAYS = float(os.getenv('ARCHIVE_RETENTION_DAYS', '90'))
+EXPIRY_INTERVAL_MINUTES = float(os.getenv('EXPIRY_INTERVAL_MINUTES', '5'))
+EXPIRY_BATCH_SIZE = 500
+HISTORY_SAMPLE_MINUTES = float(os.getenv('HISTORY_SAMPLE_MINUTES', '5'))
+# Cached account lists per user; see utils/accounts.py
+ACCOUNT_CACHE_SIZE = int(os.getenv('ACCOUNT_CACHE_SIZE', '10000'))
+ACCOUNT_CACHE_TTL = float(os.getenv('ACCOUNT_CACHE_TTL', '300'))
+
+# /server_trend periods: (label, length in seconds, bucket size in seconds)
+TREND_PERIODS = {
+    "24h": ("last 24 hours", 86400, 3600),
+    "7d": ("last 7 days", 7 * 86400, 6 * 3600),
+    "30d": ("last 30 days", 30 * 86400, 86400),
 }
-
-DINOSAURS = {
-    "Carnivores": ["Carnotaurus", "Ceratosaurus", "Deinosuchus", "Dilophosaurus", "Herrerasaurus", "Omniraptor", "Pteranodon", "Troodon"],
-    "Herbivores": ["Diabloceratops", "Dryosaurus", "Hypsilophodon", "Pachycephalosaurus", "Stegosaurus", "Tenontosaurus", "Maiasaura"],
-    "Omnivores": ["Bepiposaurus", "Gallimimus"]
-}
-
-class GameModeView(discord.ui.View):
-    def __init__(self, timeout=60):
-        super().__init__(timeout=timeout)
-        self.value = None
-
-    @discord.ui.select(placeholder="Choose a game mode", options=[discord.SelectOption(label=mode, value=mode) for mode in GAME_MODES])
-    async def select_callback(self, interaction: discord.Interaction, select: discord.ui.Select):
-        await interaction.response.defer()
-        self.value = select.values[0]
-        self.stop()
-
-class RegionView(discord.ui.View):
-    def __init__(self, game_mode: str, timeout=180):
-        super().__init__(timeout=timeout)
-        self.value = None
-        self.game_mode = game_mode
-        self.setup_options()
-
-    def setup_options(self):
-        regions = SERVERS_BY_MODE[self.game_mode].keys()
-        options = [discord.SelectOption(label=region, value=region) for region in regions]
-        self.select_menu = discord.ui.Select(placeholder="Choose a region", options=options)
-        self.select_menu.callback = self.select_callback
-        self.add_item(self.select_menu)
-
-    async def select_callback(self, interaction: discord.Interaction):
-        await interaction.response.defer()
-        self.value = self.select_menu.values[0]
-        self.stop()
-
-class SelectView(discord.ui.View):
-    def __init__(self, options, placeholder, timeout=60):
-        super().__init__(timeout=timeout)
-        self.value = None
-        self.select_menu = discord.ui.Select(placeholder=placeholder, options=options)
-        self.select_menu.callback = self.select_callback
-        self.add_item(self.select_menu)
-
-    async def select_callback(self, interaction: discord.Interaction):
-        await interaction.response.defer()
-        self.value = self.select_menu.values[0]
-        self.stop()
-
-class DinoTrackerView(discord.ui.View):
-    def __init__(self, cog: 'DinoTracker', user_id: int):
-        super().__init__(timeout=300)
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+# Game modes, servers, dinosaurs and genders live in this file; edits to it
+# are picked up within CATALOG_POLL_SECONDS, without a restart.
+CATALOG_PATH = os.getenv('CATALOG_PATH', 'catalog.json')
+CATALOG_POLL_SECONDS = float(os.getenv('CATALOG_POLL_SECONDS', '10'))
+
+class UpdateDinoSession(Session):
+    # The whole /update_dino flow runs on one ephemeral message. Every choice
+    # edits that message in place (one REST call per click) and the selects
+    # cascade: picking a value reveals the next select on the same message.
+    #
+    # To keep the clicks down, game mode and region are one select, all
+    # dinosaurs are one select (labelled by type) and gender and nested
+    # status are one button press, so an update takes four clicks. When the
+    # catalog has too many entries for that, the flow falls back to one
+    # select per choice.
+    kind = "update"
+    fields = ("accounts", "account_name", "game_mode", "region", "server",
+              "dino_type", "dinosaur", "gender", "stage")
+
+    def __init__(self, cog: 'DinoTracker', user_id: int, session_id: Optional[str] = None,
+                 accounts: List[str] = None, account_name: Optional[str] = None,
+                 game_mode: Optional[str] = None, region: Optional[str] = None,
+                 server: Optional[str] = None, dino_type: Optional[str] = None,
+                 dinosaur: Optional[str] = None, gender: Optional[str] = None,
+                 stage: str = "location"):
+        super().__init__(user_id, session_id)
         self.cog = cog
-        self.user_id = user_id
-        self.current_account = None
-        self.current_page = 0
-        self.embeds = []
-        
-        self.account_select = discord.ui.Select(
-            placeholder="Select an account",
-            options=[discord.SelectOption(label="Main Account", value="main")]
+        self.accounts = accounts or ["main"]
+        self.account_name = account_name or (self.accounts[0] if len(self.accounts) == 1 else None)
+        self.game_mode = game_mode
+        self.region = region
+        self.server = server
+        self.dino_type = dino_type
+        self.dinosaur = dinosaur
+        self.gender = gender
+        self.stage = stage
+
+    def render(self) -> discord.ui.View:
+        config = self.cog.config
+        cached = self.cog.render_cache.options
+        items = []
+        if self.stage == "location":
+            if len(self.accounts) > 1:
+                items.append(self.select("account", "Choose an account", self.accounts, self.account_name, 0,
+                                         labels={"main": "Main Account"}))
+            if self.account_name and config.places:
+                items.append(self.select("place", "Choose a game mode and region", row=1, options=cached(
+                    "places", list(config.places), config.place(self.game_mode, self.region))))
+            elif self.account_name:
+                items.append(self.select("mode", "Choose a game mode", row=1,
+                                         options=cached("modes", config.game_modes, self.game_mode)))
+                if self.game_mode:
+                    items.append(self.select("region", "Choose a region", row=2, options=cached(
+                        ("regions", self.game_mode), config.regions(self.game_mode), self.region)))
+            if self.region:
+                items.append(self.select("server", "Choose a server", row=2 if config.places else 3, options=cached(
+                    ("servers", self.game_mode, self.region), config.servers(self.game_mode, self.region), self.server)))
+        else:
+            if self.all_dinosaurs(config):
+                items.append(self.select("dinosaur", "Choose a dinosaur", row=0, options=cached(
+                    "all_dinosaurs", list(config.dinosaur_types), self.dinosaur, descriptions=config.dinosaur_types)))
+            else:
+                items.append(self.select("type", "Choose a dinosaur type", row=0,
+                                         options=cached("types", list(config.dinosaurs), self.dino_type)))
+                if self.dino_type:
+                    items.append(self.select("dinosaur", "Choose a dinosaur", row=1, options=cached(
+                        ("dinosaurs", self.dino_type), config.dinosaurs[self.dino_type], self.dinosaur)))
+            if self.gender_buttons(config):
+                if self.dinosaur:
+                    for gender in config.genders:
+                        items.append(self.button(f"nested:{gender}", f"{gender} · nested", discord.ButtonStyle.green, 2))
+                        items.append(self.button(f"not_nested:{gender}", f"{gender} · not nested", discord.ButtonStyle.red, 2))
+            elif self.dinosaur:
+                items.append(self.select("gender", "Choose gender", row=2,
+                                         options=cached("genders", config.genders, self.gender)))
+                if self.gender:
+                    items.append(self.button("nested", "Nested", discord.ButtonStyle.green, 3))
+                    items.append(self.button("not_nested", "Not nested", discord.ButtonStyle.red, 3))
+            items.append(self.button("back", "Back", row=4))
+        return self.view(*items)
+
+    @staticmethod
+    def all_dinosaurs(config: CatalogConfig) -> bool:
+        return len(config.dinosaur_types) <= MAX_OPTIONS
+
+    def gender_buttons(self, config: CatalogConfig) -> bool:
+        # Two buttons per gender, all on one row, with the gender in the custom ID
+        return len(config.genders) * 2 <= 5 and all(
+            len(self.custom_id(f"not_nested:{gender}")) <= 100 for gender in config.genders
         )
-        self.account_select.callback = self.account_select_callback
-        self.add_item(self.account_select)
-
-    async def account_select_callback(self, interaction: discord.Interaction):
-        await interaction.response.defer()
-        self.current_account = self.account_select.values[0]
-        self.current_page = 0
-        await self.update_dino_display(interaction)
-
-    @discord.ui.button(label="Previous", style=discord.ButtonStyle.gray, disabled=True, row=1)
-    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer()
-        self.current_page = max(0, self.current_page - 1)
-        await self.update_dino_display(interaction)
-
-    @discord.ui.button(label="Next", style=discord.ButtonStyle.gray, disabled=True, row=1)
-    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer()
-        self.current_page = min(len(self.embeds) - 1, self.current_page + 1)
-        await self.update_dino_display(interaction)
-
-    @discord.ui.button(label="Done", style=discord.ButtonStyle.red, row=1)
-    async def done_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer()
-        await interaction.delete_original_response()
-        self.stop()
-
-    async def update_dino_display(self, interaction: discord.Interaction):
-        if self.current_account:
-            cursor = self.cog.conn.cursor()
-            cursor.execute('''
-                SELECT server, dinosaur, gender, is_nested, date_updated, game_mode
-                FROM dino_records
-                WHERE discord_id = ? AND account_name = ?
-                ORDER BY date_updated DESC
-            ''', (self.user_id, self.current_account))
-            
-            results = cursor.fetchall()
-            self.embeds = []
-            
-            if results:
-                for server, dinosaur, gender, is_nested, date_updated, game_mode in results:
-                    embed = discord.Embed(
-                        title=f"Dinosaur on {server}",
-                        color=discord.Color.green()
-                    )
-                    embed.add_field(name="Account", value=self.current_account, inline=True)
-                    embed.add_field(name="Game Mode", value=game_mode, inline=True)
-                    embed.add_field(name="Dinosaur", value=dinosaur, inline=True)
-                    embed.add_field(name="Gender", value=gender, inline=True)
-                    embed.add_field(name="Nested", value="Yes" if is_nested else "No", inline=True)
-                    embed.add_field(name="Last Updated", value=date_updated, inline=True)
-                    self.embeds.append(embed)
-                
-                embed = self.embeds[self.current_page]
-                embed.set_footer(text=f"Page {self.current_page + 1}/{len(self.embeds)}")
-                self.previous_button.disabled = (self.current_page == 0)
-                self.next_button.disabled = (self.current_page == len(self.embeds) - 1)
-                await interaction.edit_original_response(embed=embed, view=self)
+
+    def prompt(self) -> str:
+        chosen = [value for value in (self.account_name, self.game_mode, self.server, self.dinosaur, self.gender) if value]
+        summary = f"**Updating:** {' · '.join(chosen)}\n" if chosen else ""
+        config = self.cog.config
+        if self.stage == "location":
+            if not self.account_name:
+                step = "Select an account:"
+            elif not self.region and config.places:
+                step = "Select a game mode and region:"
+            elif not self.game_mode:
+                step = "Select a game mode:"
+            elif not self.region:
+                step = "Select a region:"
             else:
-                await interaction.edit_original_response(
-                    content=f"No dinosaurs found for account: {self.current_account}",
-                    embed=None,
-                    view=self
-                )
+                step = f"Select a server in {self.region}:"
+        elif not self.dinosaur and self.all_dinosaurs(config):
+            step = "Select a dinosaur:"
+        elif not self.dino_type:
+            step = "Select a dinosaur type:"
+        elif not self.dinosaur:
+            step = f"Select a {self.dino_type}:"
+        elif self.gender_buttons(config):
+            step = "Select gender and whether the dinosaur is nested:"
+        elif not self.gender:
+            step = "Select gender:"
         else:
-            await interaction.edit_original_response(
-                content="Please select an account",
-                embed=None,
-                view=self
-            )
+            step = "Is the dinosaur nested?"
+        return summary + step
+
+    def forget_removed(self, config: CatalogConfig):
+        # The catalog may have been reloaded since the last click; drop any
+        # choice it no longer has, and everything that depended on it
+        if self.game_mode not in config.servers_by_mode:
+            self.game_mode = None
+        if self.region not in config.regions(self.game_mode):
+            self.region = None
+        if config.server_regions.get((self.game_mode, self.server)) != self.region:
+            self.server = None
+        if self.server is None:
+            self.stage = "location"
+        if self.dino_type not in config.dinosaurs:
+            self.dino_type = None
+        if config.dinosaur_types.get(self.dinosaur) != self.dino_type:
+            self.dinosaur = None
+        if self.gender not in config.genders:
+            self.gender = None
+
+    async def handle(self, interaction: discord.Interaction, action: str):
+        config = self.cog.config
+        self.forget_removed(config)
+        action, _, gender = action.partition(":")
+        if action in ("nested", "not_nested"):
+            if gender:
+                # Gender and nested status from one button
+                self.gender = gender if gender in config.genders else None
+            if self.server and self.dinosaur and self.gender:
+                await self.finish(interaction, action == "nested")
+            else:
+                await interaction.response.edit_message(
+                    content="The server or dinosaur list has changed. " + self.prompt(), view=self.render()
+                )
+            return
 
-class DinoTracker(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
-        self.conn = sqlite3.connect('dino_tracker.db')
-        self.create_tables()
-
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS dino_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id INTEGER,
-                account_name TEXT,
-                game_mode TEXT,
-                server TEXT,
-                dinosaur TEXT,
-                gender TEXT,
-                is_nested BOOLEAN,
-                date_updated TIMESTAMP
+        value = interaction.data.get("values", [None])[0]
+        if action != "account" and action != "back" and value not in self.choices(config, action):
+            # A stale menu from before a catalog reload
+            await interaction.response.edit_message(
+                content="The server or dinosaur list has changed. " + self.prompt(), view=self.render()
             )
-        ''')
-        self.conn.commit()
+            return
+        if action in ("place", "mode", "region"):
+            # Can also come from an older copy of the menu while on the dino stage
+            self.stage = "location"
+        if action == "account":
+            self.account_name = value
+        elif action == "place":
+            game_mode, region = config.places[value]
+            if (game_mode, region) != (self.game_mode, self.region):
+                self.server = None
+            self.game_mode, self.region = game_mode, region
+        elif action == "mode":
+            if value != self.game_mode:
+                self.region = None
+                self.server = None
+            self.game_mode = value
+        elif action == "region":
+            if value != self.region:
+                self.server = None
+            self.region = value
+        elif action == "server":
+            self.server = value
+            self.stage = "dino"
+        elif action == "type":
+            if value != self.dino_type:
+                self.dinosaur = None
+            self.dino_type = value
+        elif action == "dinosaur":
+            self.dino_type = config.dinosaur_types[value]
+            self.dinosaur = value
+        elif action == "gender":
+            self.gender = value
+        elif action == "back":
+            self.stage = "location"
+
+        await interaction.response.edit_message(content=self.prompt(), view=self.render())
+
+    def choices(self, config: CatalogConfig, action: str):
+        return {
+            "place": config.places,
+            "mode": config.game_modes,
+            "region": config.regions(self.game_mode),
+            "server": config.servers(self.game_mode, self.region),
+            "type": config.dinosaurs,
+            "dinosaur": config.dinosaur_types if self.all_dinosaurs(config) else config.dinosaurs.get(self.dino_type, ()),
+            "gender": config.genders,
+        }.get(action, ())
+
+    async def finish(self, interaction: discord.Interaction, is_nested: bool):
+        self.close()
+        await self.cog.save_dino(
+            interaction.user.id, self.account_name, self.game_mode, self.server,
+            self.dinosaur, self.gender, is_nested
+        )
+        await interaction.response.edit_message(
+            content=f"Updated dinosaur information for {self.account_name} on {self.server}",
+            view=None
+        )
 
-    @app_commands.command(name="update_dino", description="Update your dinosaur information")
-    async def update_dino(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
+class ServerInfoSession(Session):
+    # Game mode and region selects on one message for /server_info; picking
+    # a region posts the population embed publicly.
+    kind = "serverinfo"
+    fields = ("game_mode",)
 
-        account_name = await self.select_account(interaction)
-        if account_name is None:
-            return
+    def __init__(self, cog: 'DinoTracker', user_id: int, session_id: Optional[str] = None,
+                 game_mode: Optional[str] = None):
+        super().__init__(user_id, session_id)
+        self.cog = cog
+        self.game_mode = game_mode
 
-        game_mode = await self.select_game_mode(interaction)
-        if game_mode is None:
+    def render(self) -> discord.ui.View:
+        config = self.cog.config
+        cached = self.cog.render_cache.options
+        items = [self.select("mode", "Choose a game mode", options=cached("modes", config.game_modes, self.game_mode))]
+        if self.game_mode:
+            items.append(self.select("region", "Choose a region", options=cached(
+                ("regions", self.game_mode), config.regions(self.game_mode))))
+        return self.view(*items)
+
+    async def handle(self, interaction: discord.Interaction, action: str):
+        value = interaction.data["values"][0]
+        config = self.cog.config
+        if action == "mode" or value not in config.regions(self.game_mode):
+            # Unknown regions come from menus sent before a catalog reload
+            if action == "mode":
+                self.game_mode = value if value in config.servers_by_mode else None
+            await interaction.response.edit_message(
+                content="Select a region:" if self.game_mode else "Select a game mode:", view=self.render()
+            )
             return
 
-        region = await self.select_region(interaction, game_mode)
-        if region is None:
-            return
-    
-        server = await self.select_server(interaction, game_mode, region)
-        if server is None:
-            return
+        self.close()
+        await interaction.response.edit_message(
+            content=f"Showing dinosaur information for {value} ({self.game_mode})",
+            view=None
+        )
+        embed = await self.cog.build_server_info_embed(self.game_mode, value)
+        await self.cog.bot.outbound.followup(interaction, embed=embed, ephemeral=False)
+
+class DinoPanelSession(Session):
+    # /my_dinos panel. Record IDs are loaded lazily in keyset-paginated
+    # chunks, newest first; each page then costs a single primary-key lookup
+    # and only the embed being shown is ever built.
+    kind = "panel"
+    fields = ("accounts", "current_account", "current_page", "total_records", "record_ids", "last_key")
+    timeout = 300
+    ID_CHUNK_SIZE = 25
+
+    def __init__(self, cog: 'DinoTracker', user_id: int, session_id: Optional[str] = None,
+                 accounts: List[str] = None, current_account: Optional[str] = None,
+                 current_page: int = 0, total_records: int = 0,
+                 record_ids: List[int] = None, last_key: Optional[list] = None):
+        super().__init__(user_id, session_id)
+        self.cog = cog
+        self.accounts = accounts or ["main"]
+        self.current_account = current_account
+        self.current_page = current_page
+        self.total_records = total_records
+        self.record_ids = record_ids or []
+        self.last_key = last_key
+
+    def render(self) -> discord.ui.View:
+        return self.view(
+            self.select("account", "Select an account", self.accounts, self.current_account, 0),
+            self.button("previous", "Previous", row=1, disabled=(self.current_page == 0)),
+            self.button("next", "Next", row=1, disabled=(self.current_page >= self.total_records - 1)),
+            self.button("done", "Done", discord.ButtonStyle.red, 1)
+        )
 
-        dino_type = await self.select_dino_type(interaction)
-        if dino_type is None:
-            return
-    
-        dinosaur = await self.select_dinosaur(interaction, dino_type)
-        if dinosaur is None:
+    async def handle(self, interaction: discord.Interaction, action: str):
+        if action == "done":
+            self.close()
+            await interaction.response.defer()
+            self.cog.bot.outbound.delete_original(interaction)
             return
 
-        gender = await self.select_gender(interaction)
-        if gender is None:
-            return
+        if action == "account":
+            self.current_account = interaction.data["values"][0]
+            self.current_page = 0
+            self.record_ids = []
+            self.last_key = None
+            self.total_records = await self.load_record_ids(count=True)
+        elif action == "previous":
+            self.current_page = max(0, self.current_page - 1)
+        elif action == "next":
+            self.current_page = max(0, min(self.total_records - 1, self.current_page + 1))
+            if self.current_page >= len(self.record_ids):
+                await self.load_record_ids()
+
+        content, embed = await self.render_page()
+        await interaction.response.edit_message(content=content, embed=embed, view=self.render())
+
+    async def load_record_ids(self, count: bool = False) -> Optional[int]:
+        # Fetches the next chunk of record IDs after the last one seen,
+        # optionally counting the account's records first.
+        storage = self.cog.storage
+        total = await storage.count_records(self.user_id, self.current_account) if count else None
+        rows = await storage.record_page(self.user_id, self.current_account, self.last_key, self.ID_CHUNK_SIZE)
+        if rows:
+            self.record_ids.extend(record_id for record_id, _ in rows)
+            self.last_key = [rows[-1][1], rows[-1][0]]
+        return total
+
+    async def render_page(self):
+        if not self.current_account:
+            return "Please select an account", None
+
+        record = None
+        if self.current_page < len(self.record_ids):
+            record = await self.cog.storage.get_record(self.record_ids[self.current_page])
+
+        if not record:
+            return f"No dinosaurs found for account: {self.current_account}", None
+
+        server_id, dinosaur_id, gender_id, is_nested, date_updated, archived = record
+        catalog = self.cog.catalog
+        game_mode, _, server = catalog.server(server_id)
+        dinosaur = catalog.dinosaur_names[dinosaur_id]
+        gender = catalog.gender_names.get(gender_id)
+        embed = discord.Embed(
+            title=f"Dinosaur on {server}",
+            color=discord.Color.light_grey() if archived else discord.Color.green()
+        )
+        if archived:
+            embed.description = (f"Not updated in the last {POPULATION_WINDOW_HOURS:g} hours, so it no longer "
+                                 f"counts towards /server_info. Update it to count it again.")
+        embed.add_field(name="Account", value=self.current_account, inline=True)
+        embed.add_field(name="Game Mode", value=game_mode, inline=True)
+        embed.add_field(name="Dinosaur", value=dinosaur, inline=True)
+        embed.add_field(name="Gender", value=gender, inline=True)
+        embed.add_field(name="Nested", value="Yes" if is_nested else "No", inline=True)
+        embed.add_field(name="Last Updated", value=date_updated, inline=True)
+        embed.set_footer(text=f"Page {self.current_page + 1}/{self.total_records}")
+        return None, embed
 
-        is_nested = await self.check_if_nested(interaction)
-        if is_nested is None:
+class DinoTracker(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.storage = bot.storage
+        self.population = PopulationCache(self.storage)
+        self.accounts = AccountCache(self.storage, max_size=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
+        metrics.register_cache("accounts", self.accounts)
+        self.render_cache = RenderCache()
+        metrics.register_cache("render", self.render_cache)
+        self._rejected_mtime = None
+        self.dispatcher = bot.interaction_dispatcher
+
+    async def cog_load(self):
+        # An invalid catalog file at startup stops the cog from loading
+        await self.apply_catalog(await asyncio.to_thread(load_catalog_config, CATALOG_PATH))
+
+        # Registering the session kinds is what lets menus sent before a
+        # restart keep working afterwards.
+        for session_class in (UpdateDinoSession, ServerInfoSession, DinoPanelSession):
+            self.dispatcher.register(session_class.kind, partial(session_class, self))
+
+        # Population and alt account changes made by other bot processes
+        self.bot.events.subscribe("population", self.on_population_event)
+        self.bot.events.subscribe("accounts", self.on_accounts_event)
+
+        # Every process watches the catalog file for itself
+        self.watch_catalog.start()
+        # Maintenance only needs to run in one process
+        if self.bot.primary:
+            self.expire_stale_records.start()
+            self.sample_population.start()
+
+    async def cog_unload(self):
+        self.watch_catalog.cancel()
+        self.expire_stale_records.cancel()
+        self.sample_population.cancel()
+        self.bot.events.unsubscribe("population", self.on_population_event)
+        self.bot.events.unsubscribe("accounts", self.on_accounts_event)
+        for session_class in (UpdateDinoSession, ServerInfoSession, DinoPanelSession):
+            self.dispatcher.unregister(session_class.kind)
+
+    async def apply_catalog(self, config: CatalogConfig):
+        # Makes sure the new entries have IDs, then swaps the catalog and
+        # everything derived from it in one go (no awaits in between)
+        catalog = await self.storage.sync_catalog(config.game_modes, config.servers_by_mode,
+                                                  config.dinosaurs, config.genders)
+        # Autocomplete indexes for /quick_update. Server names repeat across
+        # game modes, so servers are picked by catalog ID.
+        server_index = SearchIndex([
+            (f"{server} ({mode})", str(catalog.server_id(mode, server)))
+            for mode, server in config.server_regions
+        ])
+        dinosaur_index = SearchIndex([(dino, dino) for dino in config.dinosaur_types])
+
+        self.config, self.catalog = config, catalog
+        self.server_index, self.dinosaur_index = server_index, dinosaur_index
+        self.render_cache.invalidate()
+        # Regions may have gained or lost servers
+        self.population.invalidate()
+
+    @tasks.loop(seconds=CATALOG_POLL_SECONDS)
+    async def watch_catalog(self):
+        try:
+            mtime = os.stat(CATALOG_PATH).st_mtime_ns
+        except OSError as e:
+            print(f"Error checking catalog file: {e}")
             return
+        if mtime == self.config.mtime or mtime == self._rejected_mtime:
+            return
+        try:
+            config = await asyncio.to_thread(load_catalog_config, CATALOG_PATH)
+            await self.apply_catalog(config)
+            print(f"Reloaded catalog from {CATALOG_PATH}: {len(config.game_modes)} game modes, "
+                  f"{len(config.server_regions)} servers, {len(config.dinosaur_types)} dinosaurs")
+        except (OSError, CatalogError) as e:
+            # Keep serving the old catalog; try again when the file changes
+            self._rejected_mtime = mtime
+            print(f"Error reloading catalog from {CATALOG_PATH}: {e}")
+        except Exception as e:
+            print(f"Error applying catalog from {CATALOG_PATH}: {e}")
 
-        cursor = self.conn.cursor()
-    
-        cursor.execute('''
-            DELETE FROM dino_records
-            WHERE discord_id = ? AND account_name = ? AND server = ?
-        ''', (interaction.user.id, account_name, server))
-
-        cursor.execute('''
-            INSERT INTO dino_records 
-            (discord_id, account_name, game_mode, server, dinosaur, gender, is_nested, date_updated)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (interaction.user.id, account_name, game_mode, server, dinosaur, gender, is_nested, datetime.now()))
-    
-        self.conn.commit()
-
-        await interaction.followup.send(
-            f"Updated dinosaur information for {account_name} on {server}", 
-            ephemeral=True
+    def on_population_event(self, payload: Optional[dict]):
+        if payload is None or payload.get("invalidate"):
+            self.population.invalidate()
+            return
+        # Reloaded rather than patched: see PopulationCache.invalidate_servers
+        self.population.invalidate_servers(
+            change[0] for old, new in payload["changes"] for change in (old, new) if change
         )
 
-    async def select_account(self, interaction: discord.Interaction) -> Optional[str]:
-        cursor = self.conn.cursor()
-    
-        # Check if alt accounts are enabled for this user
-        cursor.execute("""
-            SELECT alt_accounts_enabled, num_alt_accounts 
-            FROM user_settings 
-            WHERE discord_id = ?
-        """, (interaction.user.id,))
-    
-        result = cursor.fetchone()
-        if not result or not result[0]:  # If no settings or alt accounts disabled
-            return "main"
-    
-        # Get all alt accounts
-        cursor.execute("""
-            SELECT account_name 
-            FROM alt_accounts 
-            WHERE discord_id = ?
-        """, (interaction.user.id,))
-    
-        alt_accounts = cursor.fetchall()
-        if not alt_accounts:
-            return "main"
-        
-        # Create options for account selection
-        options = [discord.SelectOption(label="Main Account", value="main")]
-        options.extend([
-            discord.SelectOption(label=account[0], value=account[0]) 
-            for account in alt_accounts
-            ])
-    
-        view = SelectView(options, "Choose an account")
-        message = await interaction.followup.send(
-            "Select an account:", 
-            view=view, 
-            ephemeral=True
-            )
-    
-        await view.wait()
-        await message.delete()
-    
-        if view.value is None:
-            await interaction.followup.send(
-                "Selection timed out. Please try again.", 
-                ephemeral=True
-            )
-            return None
-        return view.value
+    def on_accounts_event(self, payload: Optional[dict]):
+        self.accounts.invalidate(payload and payload["discord_id"])
 
-    async def select_game_mode(self, interaction: discord.Interaction) -> Optional[str]:
-        view = GameModeView()
-        message = await interaction.followup.send("Select a game mode:", view=view, ephemeral=True)
-        await view.wait()
-        await message.delete()
-        return view.value
+    @commands.Cog.listener()
+    async def on_alt_accounts_changed(self, discord_id: int):
+        # Fired by the Settings cog after it changes a user's alt accounts
+        self.accounts.invalidate(discord_id)
 
-    async def select_region(self, interaction: discord.Interaction, game_mode: str) -> Optional[str]:
+    @tasks.loop(minutes=EXPIRY_INTERVAL_MINUTES)
+    async def expire_stale_records(self):
+        # Works in small batches, each its own write, so user updates queued
+        # behind the expiry never wait for more than one batch.
         try:
-            view = RegionView(game_mode)
-            message = await interaction.followup.send("Select a region:", view=view, ephemeral=True)
-        
-            await view.wait()
-            await message.delete()
-        
-            if view.value is None:
-                await interaction.followup.send("Selection timed out. Please try again.", ephemeral=True)
-                return None
-            
-            return view.value
-        
+            cutoff = datetime.now() - timedelta(hours=POPULATION_WINDOW_HOURS)
+            expired = 0
+            while True:
+                with self.population.writing():
+                    batch = await self.storage.expire_records(cutoff, EXPIRY_BATCH_SIZE)
+                    for record in batch:
+                        self.population.apply_change(record, None)
+                expired += len(batch)
+                if len(batch) < EXPIRY_BATCH_SIZE:
+                    break
+                await asyncio.sleep(0)
+
+            archive_cutoff = datetime.now() - timedelta(days=ARCHIVE_RETENTION_DAYS)
+            purged = 0
+            while True:
+                count = await self.storage.purge_archive(archive_cutoff, EXPIRY_BATCH_SIZE)
+                purged += count
+                if count < EXPIRY_BATCH_SIZE:
+                    break
+                await asyncio.sleep(0)
+
+            if expired or purged:
+                await self.storage.reclaim_space()
+                print(f"Archived {expired} stale dino records, purged {purged} archived records")
         except Exception as e:
-            await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
-        return None
-
-    async def select_server(self, interaction: discord.Interaction, game_mode: str, region: str) -> Optional[str]:
-        while True:
-            options = [
-                discord.SelectOption(label=server, value=server)
-                for server in SERVERS_BY_MODE[game_mode][region]
-            ]
-            view = SelectView(options, "Choose a server")
-            view.add_item(discord.ui.Button(label="Back", style=discord.ButtonStyle.grey, custom_id="back"))
-            message = await interaction.followup.send(f"Select a server in {region}:", view=view, ephemeral=True)
-            
-            def check(i):
-                return i.user.id == interaction.user.id and (
-                    i.data["custom_id"] == view.select_menu.custom_id or 
-                    i.data["custom_id"] == "back"
-                )
-
-            try:
-                select_interaction = await self.bot.wait_for("interaction", timeout=60.0, check=check)
-                await message.delete()
-                
-                if select_interaction.data["custom_id"] == "back":
-                    new_region = await self.select_region(interaction, game_mode)
-                    if new_region is None:
-                        return None
-                    region = new_region
-                else:
-                    return select_interaction.data["values"][0]
-            except asyncio.TimeoutError:
-                await message.delete()
-                await interaction.followup.send("Selection timed out. Please try again.", ephemeral=True)
-                return None
-
-    async def select_dino_type(self, interaction: discord.Interaction) -> Optional[str]:
-        options = [discord.SelectOption(label=dino_type, value=dino_type) for dino_type in DINOSAURS.keys()]
-        view = SelectView(options, "Choose a dinosaur type")
-        message = await interaction.followup.send("Select a dinosaur type:", view=view, ephemeral=True)
-        await view.wait()
-        await message.delete()
-        return view.value
-
-    async def select_dinosaur(self, interaction: discord.Interaction, dino_type: str) -> Optional[str]:
-        while True:
-            options = [discord.SelectOption(label=dino, value=dino) for dino in DINOSAURS[dino_type]]
-            view = SelectView(options, "Choose a dinosaur")
-            view.add_item(discord.ui.Button(label="Back", style=discord.ButtonStyle.grey, custom_id="back"))
-            message = await interaction.followup.send(f"Select a {dino_type}:", view=view, ephemeral=True)
-            
-            def check(i):
-                return i.user.id == interaction.user.id and (i.data["custom_id"] == view.select_menu.custom_id or i.data["custom_id"] == "back")
-
-            try:
-                select_interaction = await self.bot.wait_for("interaction", timeout=60.0, check=check)
-                await message.delete()
-                
-                if select_interaction.data["custom_id"] == "back":
-                    new_dino_type = await self.select_dino_type(interaction)
-                    if new_dino_type is None:
-                        return None
-                    dino_type = new_dino_type
-                else:
-                    return select_interaction.data["values"][0]
-            except asyncio.TimeoutError:
-                await message.delete()
-                await interaction.followup.send("Selection timed out. Please try again.", ephemeral=True)
-                return None
-    
-    async def select_gender(self, interaction: discord.Interaction) -> Optional[str]:
-        options = [discord.SelectOption(label=gender, value=gender) for gender in GENDERS]
-        view = SelectView(options, "Choose gender")
-        message = await interaction.followup.send("Select gender:", view=view, ephemeral=True)
-        await view.wait()
-        await message.delete()
-        return view.value
-
-    async def check_if_nested(self, interaction: discord.Interaction) -> Optional[bool]:
-        view = discord.ui.View()
-        yes_button = discord.ui.Button(label="Yes", style=discord.ButtonStyle.green, custom_id="yes")
-        no_button = discord.ui.Button(label="No", style=discord.ButtonStyle.red, custom_id="no")
-        view.add_item(yes_button)
-        view.add_item(no_button)
-
-        message = await interaction.followup.send("Is the dinosaur nested?", view=view, ephemeral=True)
-
-        def check(i):
-            return i.user.id == interaction.user.id and i.data["custom_id"] in ["yes", "no"]
+            print(f"Error expiring stale records: {e}")
 
+    @tasks.loop(minutes=HISTORY_SAMPLE_MINUTES)
+    async def sample_population(self):
+        # Snapshots the live totals into the history and rolls aged buckets
+        # up into coarser ones; both are cheap, bounded writes.
         try:
-            button_interaction = await self.bot.wait_for("interaction", timeout=60.0, check=check)
-            await message.delete()
-            return button_interaction.data["custom_id"] == "yes"
-        except asyncio.TimeoutError:
-            await message.delete()
-            await interaction.followup.send("Selection timed out. Please try again.", ephemeral=True)
-            return None
+            now = time.time()
+            await self.storage.record_population_sample(now)
+            await self.storage.rollup_population_history(now)
+        except Exception as e:
+            print(f"Error sampling population history: {e}")
 
-    @app_commands.command(name="server_info", description="View dinosaur information for a region")
-    async def server_info(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-    
-        game_mode = await self.select_game_mode(interaction)
-        if game_mode is None:
+    @app_commands.command(name="update_dino", description="Update your dinosaur information")
+    async def update_dino(self, interaction: discord.Interaction):
+        accounts = await self.get_accounts(interaction.user.id)
+        session = await self.dispatcher.open(UpdateDinoSession(self, interaction.user.id, accounts=accounts))
+        await interaction.response.send_message(session.prompt(), view=session.render(), ephemeral=True)
+
+    @app_commands.command(name="quick_update", description="Update a dinosaur in one step")
+    @app_commands.describe(
+        server="Server (start typing to search)",
+        dinosaur="Dinosaur (start typing to search)",
+        gender="Gender",
+        nested="Whether the dinosaur is nested",
+        account="Account to update (defaults to your main account)"
+    )
+    async def quick_update(self, interaction: discord.Interaction, server: str, dinosaur: str,
+                           gender: str, nested: bool, account: str = "main"):
+        server_id = self.server_index.resolve(server)
+        dinosaur = self.dinosaur_index.resolve(dinosaur)
+        accounts = await self.get_accounts(interaction.user.id)
+        if server_id is None or dinosaur is None or gender not in self.config.genders:
+            await interaction.response.send_message(
+                "Please pick the server, dinosaur and gender from the suggestions.", ephemeral=True
+            )
             return
-
-        region = await self.select_region(interaction, game_mode)
-        if region is None:
+        if account not in accounts:
+            await interaction.response.send_message(f"Unknown account: {account}", ephemeral=True)
             return
 
-        if region not in SERVERS_BY_MODE[game_mode]:
-            await interaction.followup.send(
-                "Invalid region. Please choose from: " + 
-                ", ".join(SERVERS_BY_MODE[game_mode].keys()), 
-                ephemeral=True
-            )
+        game_mode, _, server_name = self.catalog.server(int(server_id))
+        if (game_mode, server_name) not in self.config.server_regions:
+            # Picked just before a catalog reload removed it
+            await interaction.response.send_message("That server is no longer listed.", ephemeral=True)
             return
+        await self.save_dino(interaction.user.id, account, game_mode, server_name, dinosaur, gender, nested)
+        await interaction.response.send_message(
+            f"Updated dinosaur information for {account} on {server_name} ({game_mode})",
+            ephemeral=True
+        )
+
+    @quick_update.autocomplete("server")
+    async def quick_update_server_autocomplete(self, interaction: discord.Interaction, current: str):
+        return self.server_index.choices(current)
+
+    @quick_update.autocomplete("dinosaur")
+    async def quick_update_dinosaur_autocomplete(self, interaction: discord.Interaction, current: str):
+        return self.dinosaur_index.choices(current)
+
+    @quick_update.autocomplete("gender")
+    async def quick_update_gender_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=gender, value=gender) for gender in self.config.genders
+                if current.lower() in gender.lower()]
+
+    @quick_update.autocomplete("account")
+    async def quick_update_account_autocomplete(self, interaction: discord.Interaction, current: str):
+        accounts = await self.get_accounts(interaction.user.id)
+        return SearchIndex([("Main Account" if name == "main" else name, name) for name in accounts]).choices(current)
+
+    async def save_dino(self, discord_id: int, account_name: str, game_mode: str, server: str,
+                        dinosaur: str, gender: str, is_nested: bool):
+        server_id = self.catalog.server_id(game_mode, server)
+        dinosaur_id = self.catalog.dinosaur_ids[dinosaur]
+        gender_id = self.catalog.gender_ids[gender]
+        is_nested = int(is_nested)
 
-        servers = SERVERS_BY_MODE[game_mode][region]
-        cursor = self.conn.cursor()
+        with self.population.writing():
+            previous = await self.storage.save_record(discord_id, account_name, server_id, dinosaur_id, gender_id, is_nested)
+            self.population.apply_change(previous, (server_id, dinosaur_id, is_nested))
+
+    async def get_accounts(self, discord_id: int) -> List[str]:
+        # "main" plus the user's alt accounts, if they have them enabled
+        _, accounts = await self.accounts.get(discord_id)
+        return accounts
+
+    @app_commands.command(name="server_info", description="View dinosaur information for a region")
+    async def server_info(self, interaction: discord.Interaction):
+        session = await self.dispatcher.open(ServerInfoSession(self, interaction.user.id))
+        await interaction.response.send_message("Select a game mode:", view=session.render(), ephemeral=True)
+
+    async def build_server_info_embed(self, game_mode: str, region: str) -> discord.Embed:
+        servers = self.config.servers(game_mode, region)
+        server_ids = [self.catalog.server_id(game_mode, server) for server in servers]
+        population = await self.population.get_region(game_mode, region, server_ids)
+        # Version of the totals just read; None if they aren't cached, in
+        # which case neither is the embed
+        version = self.population.version(game_mode, region)
+        if version is not None:
+            embed = self.render_cache.embed((game_mode, region), version)
+            if embed is not None:
+                return embed
 
         embed = discord.Embed(
             title=f"Dinosaur Information for {region} ({game_mode})",
             color=discord.Color.blue()
         )
 
-        for server in servers:
-            cursor.execute('''
-                SELECT dinosaur, is_nested, COUNT(*) as count
-                FROM dino_records
-                WHERE server = ? AND game_mode = ?
-                GROUP BY dinosaur, is_nested
-            ''', (server, game_mode))
-            
-            results = cursor.fetchall()
+        for server, server_id in zip(servers, server_ids):
+            results = sorted(
+                (self.catalog.dinosaur_names[dinosaur_id], nested, count)
+                for (dinosaur_id, nested), count in population[server_id].items()
+            )
 
             if results:
                 server_info = "\n".join([
@@ -458,42 +650,88 @@ class DinoTracker(commands.Cog):
             else:
                 embed.add_field(name=server, value="No data available", inline=False)
 
-        await interaction.followup.send(embed=embed, ephemeral=False)
+        embed.set_footer(text=f"Counting dinosaurs updated in the last {POPULATION_WINDOW_HOURS:g} hours")
+        if version is not None:
+            self.render_cache.store_embed((game_mode, region), version, embed)
+        return embed
     
+    @app_commands.command(name="server_trend", description="View how a server's dinosaur population has changed")
+    @app_commands.describe(game_mode="Game mode", server="Server", period="Time period to show")
+    @app_commands.choices(
+        period=[app_commands.Choice(name=label, value=key) for key, (label, _, _) in TREND_PERIODS.items()]
+    )
+    async def server_trend(self, interaction: discord.Interaction, game_mode: str, server: str, period: str = "24h"):
+        if (game_mode, server) not in self.catalog.server_ids:
+            await interaction.response.send_message("Unknown server for that game mode.", ephemeral=True)
+            return
+
+        label, length, step = TREND_PERIODS[period]
+        server_id = self.catalog.server_id(game_mode, server)
+        buckets, series = await self.storage.load_trend(server_id, time.time() - length, step)
+
+        embed = discord.Embed(
+            title=f"Dinosaur Trend for {server} ({game_mode})",
+            color=discord.Color.blue()
+        )
+        if not series:
+            embed.description = "No history recorded for this period yet."
+        else:
+            lines = []
+            for dino, counts in sorted((self.catalog.dinosaur_names[dinosaur_id], counts)
+                                       for dinosaur_id, counts in series.items()):
+                peak = max(counts)
+                spark = "".join(
+                    SPARK_CHARS[round(count / peak * (len(SPARK_CHARS) - 1))] if peak else SPARK_CHARS[0]
+                    for count in counts
+                )
+                lines.append(f"{dino}\n`{spark}` now {counts[-1]:.0f}, avg {sum(counts) / len(counts):.1f}, peak {peak:.0f}")
+            embed.description = "\n".join(lines)
+        embed.set_footer(text=f"{label.capitalize()}, {len(buckets)} points")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @server_trend.autocomplete("game_mode")
+    async def server_trend_game_mode_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=mode, value=mode) for mode in self.config.game_modes
+                if current.lower() in mode.lower()]
+
+    @server_trend.autocomplete("server")
+    async def server_trend_server_autocomplete(self, interaction: discord.Interaction, current: str):
+        game_mode = interaction.namespace.game_mode
+        current = current.lower()
+        return [
+            app_commands.Choice(name=name, value=name)
+            for region, servers in self.config.servers_by_mode.get(game_mode, {}).items()
+            for name in servers
+            if current in name.lower()
+        ][:25]
+
     @app_commands.command(name="my_dinos", description="View your dinosaurs across accounts and servers")
     async def my_dinos(self, interaction: discord.Interaction):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT alt_accounts_enabled 
-            FROM user_settings 
-            WHERE discord_id = ?
-        """, (interaction.user.id,))
+        accounts = await self.get_accounts(interaction.user.id)
     
-        result = cursor.fetchone()
-        alt_accounts_enabled = result[0] if result else False
-    
-        if alt_accounts_enabled:
-            cursor.execute("""
-                SELECT account_name 
-                FROM alt_accounts 
-                WHERE discord_id = ?
-            """, (interaction.user.id,))
-            accounts = ["main"] + [row[0] for row in cursor.fetchall()]
-        else:
-            accounts = ["main"]
-    
-        view = DinoTrackerView(self, interaction.user.id)
-        view.account_select.options = [
-            discord.SelectOption(label=account, value=account) 
-            for account in accounts
-        ]
-    
-        await interaction.response.send_message(
-            "Loading your dinosaurs...", 
-            view=view, 
+        session = await self.dispatcher.open(DinoPanelSession(self, interaction.user.id, accounts=accounts))
+        content, embed = await session.render_page()
+        await interaction.response.send_message(content, embed=embed, view=session.render(), ephemeral=True)
+
+    @app_commands.command(name="verify_population", description="Check the population totals against the records (Owner only)")
+    @is_owner()
+    async def verify_population(self, interaction: discord.Interaction, rebuild: bool = False):
+        await interaction.response.defer(ephemeral=True)
+
+        mismatches = await self.storage.count_population_mismatches()
+        if not rebuild:
+            await interaction.followup.send(
+                f"Population totals checked: {mismatches} mismatched rows",
+                ephemeral=True
+            )
+            return
+
+        rows = await self.storage.rebuild_population()
+        self.population.invalidate()
+        await interaction.followup.send(
+            f"Population totals rebuilt ({mismatches} mismatched rows before, {rows} rows now) ✓",
             ephemeral=True
         )
-        await view.update_dino_display(interaction)
 
 async def setup(bot):
     await bot.add_cog(DinoTracker(bot))
\ No newline at end of file
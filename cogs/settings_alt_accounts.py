@@ -1,81 +1,107 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import sqlite3
-import asyncio
+from functools import partial
+from typing import List, Optional
+
+from utils.dispatcher import Session
+
+MAX_ALT_ACCOUNTS = 10
+MAX_ALT_NAME_LENGTH = 100
+# Room for MAX_ALT_ACCOUNTS names of full length, one per line
+MAX_NAMES_LENGTH = MAX_ALT_ACCOUNTS * (MAX_ALT_NAME_LENGTH + 1)
+
+def name_error(name: str) -> Optional[str]:
+    # Rules every alt account name follows, however it is entered
+    if not name:
+        return "Alt account names can't be empty."
+    if name.lower() == "main":
+        return "'main' is reserved for your main account."
+    if len(name) > MAX_ALT_NAME_LENGTH:
+        return f"Alt account names can be at most {MAX_ALT_NAME_LENGTH} characters long."
+    return None
+
+class AltAccountsSession(Session):
+    # Alt account setup for /toggle_alt_accounts: a modal takes every name at
+    # once (one per line), so no message content is needed. Invalid input
+    # gets a "Try again" button that reopens the modal.
+    kind = "alts"
+    timeout = 600  # Time to fill in the modal
+
+    def __init__(self, cog: 'Settings', user_id: int, session_id: Optional[str] = None):
+        super().__init__(user_id, session_id)
+        self.cog = cog
+
+    def form(self, names: List[str]) -> discord.ui.Modal:
+        return self.modal("names", "Set up alt accounts", discord.ui.TextInput(
+            label=f"Alt account names, one per line (max {MAX_ALT_ACCOUNTS})",
+            custom_id="names",
+            style=discord.TextStyle.paragraph,
+            # Names saved with /name_alt aren't limited in number, so the
+            # pre-filled list is cut to what the field accepts
+            default="\n".join(names)[:MAX_NAMES_LENGTH] or None,
+            placeholder="Alt one\nAlt two",
+            max_length=MAX_NAMES_LENGTH
+        ))
+
+    async def handle(self, interaction: discord.Interaction, action: str):
+        if action == "open":
+            names = await self.cog.storage.list_alt_accounts(self.user_id)
+            await interaction.response.send_modal(self.form(names))
+            return
+
+        names = [line.strip() for line in self.submitted(interaction).get("names", "").splitlines() if line.strip()]
+        error = None
+        if not 1 <= len(names) <= MAX_ALT_ACCOUNTS:
+            error = f"Please enter between 1 and {MAX_ALT_ACCOUNTS} names, one per line."
+        elif len({name.lower() for name in names}) != len(names):
+            error = "Each alt account needs a unique name."
+        else:
+            error = next(filter(None, map(name_error, names)), None)
+        if error:
+            retry = self.view(self.button("open", "Try again", style=discord.ButtonStyle.primary))
+            await self.respond(interaction, error, retry)
+            return
+
+        self.close()
+        await self.cog.storage.set_alt_accounts(self.user_id, names)
+        self.cog.changed(self.user_id)
+        alt_list = "\n".join(f"{i+1}. {name}" for i, name in enumerate(names))
+        await self.respond(interaction, f"All alt accounts have been set up successfully!\n{alt_list}", None)
+
+    @staticmethod
+    async def respond(interaction: discord.Interaction, content: str, view: Optional[discord.ui.View]):
+        # Submits of a modal reopened from "Try again" replace that message
+        if interaction.message is None:
+            await interaction.response.send_message(content, view=view or discord.utils.MISSING, ephemeral=True)
+        else:
+            await interaction.response.edit_message(content=content, view=view)
 
 class Settings(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.conn = sqlite3.connect('dino_tracker.db')
-        self.create_tables()
-
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_settings (
-            discord_id INTEGER PRIMARY KEY,
-            alt_accounts_enabled BOOLEAN DEFAULT 0,
-            num_alt_accounts INTEGER DEFAULT 0
-        )
-        ''')
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS alt_accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id INTEGER,
-            account_name TEXT,
-            FOREIGN KEY (discord_id) REFERENCES user_settings (discord_id)
-        )
-        ''')
-        self.conn.commit()
+        self.storage = bot.storage
+        self.dispatcher = bot.interaction_dispatcher
+
+    async def cog_load(self):
+        self.dispatcher.register(AltAccountsSession.kind, partial(AltAccountsSession, self))
+
+    async def cog_unload(self):
+        self.dispatcher.unregister(AltAccountsSession.kind)
+
+    def changed(self, discord_id: int):
+        # Lets other cogs drop what they cached about the user's accounts
+        self.bot.dispatch("alt_accounts_changed", discord_id)
 
     @app_commands.command(name="toggle_alt_accounts", description="Toggle alt accounts feature")
     async def toggle_alt_accounts(self, interaction: discord.Interaction, enable: bool):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-        INSERT OR REPLACE INTO user_settings (discord_id, alt_accounts_enabled)
-        VALUES (?, ?)
-        """, (interaction.user.id, enable))
-        self.conn.commit()
+        await self.storage.set_alt_accounts_enabled(interaction.user.id, enable)
+        self.changed(interaction.user.id)
         
         if enable:
-            await interaction.response.send_message("Alt accounts feature has been enabled. How many alt accounts do you want to set up? (Max 10)", ephemeral=True)
-            
-            def check(m):
-                return m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-
-            try:
-                num_alts_msg = await self.bot.wait_for('message', check=check, timeout=30.0)
-                num_alts = int(num_alts_msg.content)
-                
-                if num_alts < 1 or num_alts > 10:
-                    await interaction.followup.send("Please enter a number between 1 and 10. You can adjust this later using the /set_num_alts command.", ephemeral=True)
-                    return
-
-                cursor.execute("""
-                UPDATE user_settings SET num_alt_accounts = ? WHERE discord_id = ?
-                """, (num_alts, interaction.user.id))
-                self.conn.commit()
-
-                await interaction.followup.send(f"Great! You've set up {num_alts} alt accounts. Let's name them now.", ephemeral=True)
-
-                for i in range(1, num_alts + 1):
-                    await interaction.followup.send(f"Please enter a name for alt account #{i}:", ephemeral=True)
-                    name_msg = await self.bot.wait_for('message', check=check, timeout=30.0)
-                    name = name_msg.content
-
-                    cursor.execute("""
-                    INSERT INTO alt_accounts (discord_id, account_name)
-                    VALUES (?, ?)
-                    """, (interaction.user.id, name))
-                    self.conn.commit()
-
-                await interaction.followup.send("All alt accounts have been set up successfully!", ephemeral=True)
-
-            except asyncio.TimeoutError:
-                await interaction.followup.send("You didn't respond in time. You can set up your alt accounts later using the /set_num_alts and /name_alt commands.", ephemeral=True)
-            except ValueError:
-                await interaction.followup.send("Invalid input. Please use the /set_num_alts command to try again.", ephemeral=True)
+            session = await self.dispatcher.open(AltAccountsSession(self, interaction.user.id))
+            names = await self.storage.list_alt_accounts(interaction.user.id)
+            await interaction.response.send_modal(session.form(names))
         else:
             await interaction.response.send_message("Alt accounts feature has been disabled.", ephemeral=True)
 
@@ -85,47 +111,42 @@ class Settings(commands.Cog):
             await interaction.response.send_message("Please enter a number between 0 and 10.", ephemeral=True)
             return
 
-        cursor = self.conn.cursor()
-        cursor.execute("""
-        UPDATE user_settings SET num_alt_accounts = ? WHERE discord_id = ?
-        """, (num_alts, interaction.user.id))
-        self.conn.commit()
-
-        # Clear existing alt accounts
-        cursor.execute("DELETE FROM alt_accounts WHERE discord_id = ?", (interaction.user.id,))
-        self.conn.commit()
+        # Also clears the existing alt accounts
+        await self.storage.set_num_alt_accounts(interaction.user.id, num_alts, clear=True)
+        self.changed(interaction.user.id)
 
         await interaction.response.send_message(f"Number of alt accounts set to {num_alts}. Use the /name_alt command to name your accounts.", ephemeral=True)
 
     @app_commands.command(name="name_alt", description="Name an alt account")
     async def name_alt(self, interaction: discord.Interaction, alt_number: int, name: str):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT num_alt_accounts FROM user_settings WHERE discord_id = ?", (interaction.user.id,))
-        result = cursor.fetchone()
+        settings = await self.storage.get_settings(interaction.user.id)
 
-        if not result or alt_number > result[0]:
+        if not settings or not 1 <= alt_number <= settings[1]:
             await interaction.response.send_message("Invalid alt account number.", ephemeral=True)
             return
 
-        cursor.execute("""
-        INSERT OR REPLACE INTO alt_accounts (discord_id, account_name)
-        VALUES (?, ?)
-        """, (interaction.user.id, name))
-        self.conn.commit()
+        name = name.strip()
+        error = name_error(name)
+        if not error and name.lower() in (alt.lower() for alt in await self.storage.list_alt_accounts(interaction.user.id)):
+            error = "Each alt account needs a unique name."
+        if error:
+            await interaction.response.send_message(error, ephemeral=True)
+            return
+
+        await self.storage.add_alt_account(interaction.user.id, name)
+        self.changed(interaction.user.id)
 
         await interaction.response.send_message(f"Alt account {alt_number} named as '{name}'.", ephemeral=True)
 
     @app_commands.command(name="list_alts", description="List all your alt accounts")
     async def list_alts(self, interaction: discord.Interaction):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT account_name FROM alt_accounts WHERE discord_id = ?", (interaction.user.id,))
-        results = cursor.fetchall()
+        results = await self.storage.list_alt_accounts(interaction.user.id)
 
         if not results:
             await interaction.response.send_message("You haven't set up any alt accounts yet.", ephemeral=True)
             return
 
-        alt_list = "\n".join([f"{i+1}. {name[0]}" for i, name in enumerate(results)])
+        alt_list = "\n".join([f"{i+1}. {name}" for i, name in enumerate(results)])
         await interaction.response.send_message(f"Your alt accounts:\n{alt_list}", ephemeral=True)
 
 async def setup(bot):
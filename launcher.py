@@ -0,0 +1,119 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+from dotenv import load_dotenv
+
+# Runs DinoBot as several processes ("clusters"), each connecting its own
+# slice of the shards, all sharing the one SQLite database. Cluster 0 is the
+# primary (command sync and maintenance tasks). Crashed clusters are
+# restarted; Ctrl+C / SIGTERM stops them all.
+load_dotenv()
+TOKEN = os.getenv('DISCORD_BOT_TOKEN')
+TOTAL_SHARDS = int(os.getenv('TOTAL_SHARDS', '0'))
+CLUSTERS = int(os.getenv('CLUSTERS', '0')) or os.cpu_count() or 1
+RESTART_DELAY = 5
+# Discord allows max_concurrency identifies per 5 seconds
+IDENTIFY_INTERVAL = 5
+
+
+def gateway_info():
+    response = requests.get(
+        'https://discord.com/api/v10/gateway/bot',
+        headers={'Authorization': f'Bot {TOKEN}'},
+        timeout=10
+    )
+    response.raise_for_status()
+    data = response.json()
+    return data['shards'], data['session_start_limit']['max_concurrency']
+
+
+def split_shards(total: int, clusters: int):
+    # Contiguous, near-equal blocks of shard IDs; never more clusters than shards
+    clusters = min(clusters, total)
+    size, extra = divmod(total, clusters)
+    blocks, start = [], 0
+    for cluster in range(clusters):
+        end = start + size + (cluster < extra)
+        blocks.append(list(range(start, end)))
+        start = end
+    return blocks
+
+
+def spawn(cluster_id: int, shard_ids, total: int, clusters: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SHARD_COUNT=str(total),
+        SHARD_IDS=','.join(map(str, shard_ids)),
+        CLUSTER_ID=str(cluster_id),
+        CLUSTER_COUNT=str(clusters)
+    )
+    print(f'Starting cluster {cluster_id} with shards {shard_ids[0]}-{shard_ids[-1]}')
+    return subprocess.Popen([sys.executable, 'bot.py'], env=env)
+
+
+def supervise(processes, respawn, stopping, clock=time.monotonic, sleep=time.sleep):
+    # Checks the cluster processes once a second until stopping() is true;
+    # a cluster that exited is respawned with respawn(cluster_id) once
+    # RESTART_DELAY seconds have passed.
+    restart_at = {}
+    while not stopping():
+        sleep(1)
+        for cluster_id, process in list(processes.items()):
+            if process.poll() is None:
+                continue
+            if cluster_id not in restart_at:
+                print(f'Cluster {cluster_id} exited with code {process.returncode}; restarting in {RESTART_DELAY}s')
+                restart_at[cluster_id] = clock() + RESTART_DELAY
+            elif clock() >= restart_at[cluster_id]:
+                del restart_at[cluster_id]
+                processes[cluster_id] = respawn(cluster_id)
+
+
+def main():
+    recommended, max_concurrency = gateway_info()
+    total = TOTAL_SHARDS or recommended
+    blocks = split_shards(total, CLUSTERS)
+    print(f'Running {total} shards in {len(blocks)} clusters')
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    processes = {}
+    for cluster_id, shard_ids in enumerate(blocks):
+        if stopping:
+            break
+        processes[cluster_id] = spawn(cluster_id, shard_ids, total, len(blocks))
+        # Stagger starts so the clusters don't all identify at once. The
+        # other clusters wait for the primary's migrations themselves (see
+        # DinoBot.wait_for_schema).
+        time.sleep(IDENTIFY_INTERVAL * len(shard_ids) / max_concurrency)
+
+    supervise(
+        processes,
+        lambda cluster_id: spawn(cluster_id, blocks[cluster_id], total, len(blocks)),
+        lambda: stopping
+    )
+
+    print('Stopping clusters...')
+    for process in processes.values():
+        if process.poll() is None:
+            process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import launcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeProcess:
+    def __init__(self, exits_at=None, returncode=1):
+        self.exits_at = exits_at
+        self.returncode = None
+        self._exit_code = returncode
+        self.clock = None
+
+    def poll(self):
+        if self.exits_at is not None and self.clock() >= self.exits_at:
+            self.returncode = self._exit_code
+        return self.returncode
+
+
+def run(processes, until, respawn):
+    clock = FakeClock()
+    for process in processes.values():
+        process.clock = clock
+
+    def respawned(cluster_id):
+        process = respawn(cluster_id, clock())
+        process.clock = clock
+        return process
+
+    launcher.supervise(processes, respawned, lambda: clock.now >= until, clock=clock, sleep=clock.sleep)
+    return clock
+
+
+def test_crashed_cluster_is_restarted_after_the_delay():
+    spawned = []
+
+    def respawn(cluster_id, now):
+        spawned.append((cluster_id, now))
+        return FakeProcess()
+
+    processes = {0: FakeProcess(), 1: FakeProcess(exits_at=3)}
+    run(processes, 30, respawn)
+    assert spawned == [(1, 3 + launcher.RESTART_DELAY)]
+    assert processes[1].poll() is None
+    assert processes[0].poll() is None
+
+
+def test_cluster_that_keeps_crashing_is_restarted_each_time():
+    spawned = []
+
+    def respawn(cluster_id, now):
+        spawned.append(now)
+        return FakeProcess(exits_at=now + 1)
+
+    run({0: FakeProcess(exits_at=1)}, 30, respawn)
+    # exits 1s after each start, waits RESTART_DELAY, and the first poll
+    # after an exit only schedules the restart
+    assert spawned == [6, 12, 18, 24, 30]
+
+
+def test_running_clusters_are_left_alone():
+    def respawn(cluster_id, now):
+        raise AssertionError('nothing should be respawned')
+
+    clock = run({0: FakeProcess(), 1: FakeProcess()}, 30, respawn)
+    assert clock.now == 30
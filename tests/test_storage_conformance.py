@@ -0,0 +1,247 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.database import Database
+from utils.memory_storage import MemoryStorage
+from utils.schema import migrate
+from utils.storage import SQLiteStorage
+
+# Behaviour every Storage implementation must share, checked against both
+# built-in backends. Each test gets a fresh, empty storage.
+
+GAME_MODES = ["Mode A", "Mode B"]
+SERVERS_BY_MODE = {
+    "Mode A": {"North": ["A1", "A2"], "South": ["A3"]},
+    "Mode B": {"North": ["A1", "B2"]},
+}
+DINOSAURS = {"Carnivores": ["Rex", "Raptor"], "Herbivores": ["Trike"]}
+GENDERS = ["Male", "Female"]
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def make_storage(request, tmp_path):
+    async def sqlite():
+        db = Database(str(tmp_path / "conformance.db"), readers=2)
+        await db.connect()
+        await db.run(migrate)
+        return SQLiteStorage(db), db.close
+
+    async def memory():
+        async def close():
+            pass
+
+        return MemoryStorage(), close
+
+    return sqlite if request.param == "sqlite" else memory
+
+
+def storage_test(check):
+    # The storages need a running event loop, so each check runs in its own
+    def test(make_storage):
+        async def run():
+            storage, close = await make_storage()
+            try:
+                await check(storage)
+            finally:
+                await close()
+
+        asyncio.run(run())
+
+    test.__name__ = check.__name__
+    return test
+
+
+async def _catalog(storage):
+    return await storage.sync_catalog(GAME_MODES, SERVERS_BY_MODE, DINOSAURS, GENDERS)
+
+
+@storage_test
+async def test_catalog_ids_are_stable(storage):
+    first = await _catalog(storage)
+    second = await _catalog(storage)
+    assert first.server_ids == second.server_ids
+    assert first.dinosaur_ids == second.dinosaur_ids
+    # Same server name in two modes gets two IDs
+    assert first.server_id("Mode A", "A1") != first.server_id("Mode B", "A1")
+    assert first.server(first.server_id("Mode A", "A3")) == ("Mode A", "South", "A3")
+    assert first.gender_names[first.gender_ids["Female"]] == "Female"
+
+
+@storage_test
+async def test_save_record_upserts(storage):
+    catalog = await _catalog(storage)
+    server = catalog.server_id("Mode A", "A1")
+    rex, trike = catalog.dinosaur_ids["Rex"], catalog.dinosaur_ids["Trike"]
+    male = catalog.gender_ids["Male"]
+
+    assert await storage.save_record(1, "main", server, rex, male, False) is None
+    previous = await storage.save_record(1, "main", server, trike, male, True)
+    assert tuple(previous) == (server, rex, 0)
+    # Another account or user on the same server is a separate record
+    assert await storage.save_record(1, "alt", server, rex, male, False) is None
+    assert await storage.save_record(2, "main", server, rex, male, False) is None
+
+    assert await storage.count_records(1, "main") == 1
+    assert await storage.count_records(1, "alt") == 1
+    assert await storage.count_records(3, "main") == 0
+    [(record_id, _)] = await storage.record_page(1, "main", None, 10)
+    server_id, dinosaur_id, gender_id, is_nested, date_updated, archived = await storage.get_record(record_id)
+    assert (server_id, dinosaur_id, gender_id, is_nested, archived) == (server, trike, male, 1, False)
+    assert isinstance(date_updated, str) and date_updated.startswith(str(datetime.now().year))
+    assert await storage.get_record(-1) is None
+
+
+@storage_test
+async def test_record_pages_are_keyset_paginated(storage):
+    catalog = await _catalog(storage)
+    rex, male = catalog.dinosaur_ids["Rex"], catalog.gender_ids["Male"]
+    servers = list(catalog.servers)
+    for server in servers:
+        await storage.save_record(1, "main", server, rex, male, False)
+    # Updating the first record makes it the newest
+    await storage.save_record(1, "main", servers[0], rex, male, True)
+
+    seen, after = [], None
+    while True:
+        page = await storage.record_page(1, "main", after, 2)
+        if not page:
+            break
+        assert len(page) <= 2
+        seen.extend(page)
+        after = [page[-1][1], page[-1][0]]
+    assert len(seen) == len(servers)
+    assert len({record_id for record_id, _ in seen}) == len(servers)
+    keys = [(date_updated, record_id) for record_id, date_updated in seen]
+    assert keys == sorted(keys, reverse=True)
+    assert (await storage.get_record(seen[0][0]))[0] == servers[0]
+
+
+@storage_test
+async def test_population_tracks_records(storage):
+    catalog = await _catalog(storage)
+    a1, a2 = catalog.server_id("Mode A", "A1"), catalog.server_id("Mode A", "A2")
+    rex, trike = catalog.dinosaur_ids["Rex"], catalog.dinosaur_ids["Trike"]
+    male = catalog.gender_ids["Male"]
+    await storage.save_record(1, "main", a1, rex, male, False)
+    await storage.save_record(2, "main", a1, rex, male, False)
+    await storage.save_record(3, "main", a1, rex, male, True)
+    await storage.save_record(3, "main", a1, trike, male, True)
+    await storage.save_record(1, "main", a2, trike, male, False)
+
+    population = await storage.population([a1, a2, catalog.server_id("Mode A", "A3")])
+    assert dict(population[a1]) == {(rex, 0): 2, (trike, 1): 1}
+    assert dict(population[a2]) == {(trike, 0): 1}
+    assert not population[catalog.server_id("Mode A", "A3")]
+    assert await storage.count_population_mismatches() == 0
+    assert await storage.rebuild_population() == 3
+
+
+@storage_test
+async def test_expiry_archives_old_records(storage):
+    catalog = await _catalog(storage)
+    server, rex, male = catalog.server_id("Mode A", "A1"), catalog.dinosaur_ids["Rex"], catalog.gender_ids["Male"]
+    for user in range(1, 6):
+        await storage.save_record(user, "main", server, rex, male, False)
+
+    assert await storage.expire_records(datetime.now() - timedelta(hours=1), 10) == []
+    future = datetime.now() + timedelta(hours=1)
+    first = await storage.expire_records(future, 3)
+    rest = await storage.expire_records(future, 3)
+    assert len(first) == 3 and len(rest) == 2
+    assert all(tuple(key) == (server, rex, 0) for key in first + rest)
+    assert not (await storage.population([server]))[server]
+    assert await storage.count_population_mismatches() == 0
+    # Archived records are still listed, flagged as archived
+    assert await storage.count_records(1, "main") == 1
+    [(record_id, _)] = await storage.record_page(1, "main", None, 10)
+    assert (await storage.get_record(record_id))[5] is True
+
+    assert await storage.purge_archive(datetime.now() - timedelta(hours=1), 10) == 0
+    assert await storage.purge_archive(future, 4) == 4
+    assert await storage.purge_archive(future, 4) == 1
+    assert await storage.count_records(1, "main") == 0
+    assert await storage.get_record(record_id) is None
+    await storage.reclaim_space()
+
+
+@storage_test
+async def test_saving_revives_archived_records(storage):
+    catalog = await _catalog(storage)
+    a1, a2, a3 = (catalog.server_id("Mode A", server) for server in ("A1", "A2", "A3"))
+    rex, trike, male = catalog.dinosaur_ids["Rex"], catalog.dinosaur_ids["Trike"], catalog.gender_ids["Male"]
+    await storage.save_record(1, "main", a1, rex, male, False)
+    await storage.save_record(1, "main", a2, rex, male, False)
+    await storage.expire_records(datetime.now() + timedelta(hours=1), 10)
+    await storage.save_record(1, "main", a3, rex, male, False)
+
+    # The archived record for a1 is replaced, not listed twice, and the
+    # revived record counts again
+    assert await storage.save_record(1, "main", a1, trike, male, True) is None
+    assert await storage.count_records(1, "main") == 3
+    page = await storage.record_page(1, "main", None, 10)
+    records = [await storage.get_record(record_id) for record_id, _ in page]
+    assert [(record[0], record[5]) for record in records] == [(a1, False), (a3, False), (a2, True)]
+    assert dict((await storage.population([a1]))[a1]) == {(trike, 1): 1}
+
+    # Pages run across live and archived records alike
+    assert await storage.record_page(1, "main", None, 2) == page[:2]
+    assert await storage.record_page(1, "main", [page[1][1], page[1][0]], 2) == page[2:]
+    assert await storage.count_population_mismatches() == 0
+
+
+@storage_test
+async def test_settings_and_alt_accounts(storage):
+    assert await storage.get_settings(1) is None
+    assert await storage.list_alt_accounts(1) == []
+
+    await storage.set_alt_accounts_enabled(1, True)
+    assert await storage.get_settings(1) == (True, 0)
+    await storage.set_num_alt_accounts(1, 2)
+    await storage.add_alt_account(1, "alt one")
+    await storage.add_alt_account(1, "alt two")
+    assert await storage.get_settings(1) == (True, 2)
+    assert await storage.list_alt_accounts(1) == ["alt one", "alt two"]
+    assert await storage.list_alt_accounts(2) == []
+
+    await storage.set_num_alt_accounts(1, 3, clear=True)
+    assert await storage.get_settings(1) == (True, 3)
+    assert await storage.list_alt_accounts(1) == []
+
+    await storage.set_alt_accounts(1, ["a", "b", "c", "d"])
+    assert await storage.get_settings(1) == (True, 4)
+    assert await storage.list_alt_accounts(1) == ["a", "b", "c", "d"]
+
+    # Re-toggling replaces the settings row
+    await storage.set_alt_accounts_enabled(1, False)
+    assert await storage.get_settings(1) == (False, 0)
+
+
+@storage_test
+async def test_history_rolls_up_and_averages(storage):
+    catalog = await _catalog(storage)
+    server, rex, male = catalog.server_id("Mode A", "A1"), catalog.dinosaur_ids["Rex"], catalog.gender_ids["Male"]
+    await storage.save_record(1, "main", server, rex, male, False)
+    await storage.save_record(2, "main", server, rex, male, True)
+
+    start = 1_000_000_000 // 86400 * 86400
+    now = start
+    for minute in range(3 * 24 * 60):
+        now = start + minute * 60
+        if minute == 2 * 24 * 60:
+            await storage.save_record(3, "main", server, rex, male, False)
+        await storage.record_population_sample(now)
+        if minute % 60 == 0:
+            await storage.rollup_population_history(now)
+    await storage.rollup_population_history(now)
+
+    buckets, series = await storage.load_trend(server, start, 86400)
+    assert buckets == [start, start + 86400, start + 2 * 86400]
+    assert series == {rex: [2.0, 2.0, 3.0]}
+    buckets, series = await storage.load_trend(server, now - 3 * 3600, 3600)
+    assert len(buckets) == 4 and series[rex] == [3.0] * 4
+    # Other servers share the sample buckets but have no series
+    assert await storage.load_trend(catalog.server_id("Mode A", "A2"), start, 86400) == (
+        [start, start + 86400, start + 2 * 86400], {}
+    )
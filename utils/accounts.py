@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+
+class AccountCache:
+    # Per-user (alt accounts enabled, account names), which the tracker
+    # needs for every /update_dino, /quick_update and /my_dinos but which
+    # only change through the Settings cog. Bounded LRU with a TTL: the
+    # Settings cog fires an "alt_accounts_changed" event after each change,
+    # other bot processes' changes arrive through the event bus, and the TTL
+    # is only a backstop.
+    def __init__(self, storage, max_size: int = 10000, ttl: float = 300):
+        self.storage = storage
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # discord_id -> (expires_at, enabled, accounts)
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, discord_id: int) -> Tuple[bool, List[str]]:
+        entry = self._entries.get(discord_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(discord_id)
+            self.hits += 1
+            return entry[1], list(entry[2])
+
+        self.misses += 1
+        generation = self._generation
+        settings = await self.storage.get_settings(discord_id)
+        enabled = bool(settings and settings[0])
+        accounts = ["main"] + (await self.storage.list_alt_accounts(discord_id) if enabled else [])
+        # Same rule as PopulationCache: don't cache what an invalidation
+        # that landed mid-load may have made stale
+        if generation == self._generation:
+            self._entries[discord_id] = (time.monotonic() + self.ttl, enabled, tuple(accounts))
+            self._entries.move_to_end(discord_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return enabled, accounts
+
+    def invalidate(self, discord_id: int = None):
+        self._generation += 1
+        if discord_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(discord_id, None)
@@ -0,0 +1,67 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import List
+
+SUFFIX = '.db.gz'
+
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def snapshot_database(path: str, directory: str, pages: int = 1024, step_delay: float = 0.0) -> str:
+    # Blocking; run it in a worker thread. Copies the live database with
+    # SQLite's online backup API, pages at a time, sleeping step_delay
+    # seconds between steps so the writer keeps most of the disk. The copy
+    # runs inside one read transaction on its own connection: in WAL mode
+    # that is a fixed snapshot, so writes made meanwhile neither block on it
+    # nor restart it (the WAL just can't be checkpointed past it until the
+    # copy is done). The copy is then gzipped to
+    # <directory>/<name>-<YYYYmmdd-HHMMSS>.db.gz, and that path returned.
+    os.makedirs(directory, exist_ok=True)
+    name = f'{_stem(path)}-{datetime.now():%Y%m%d-%H%M%S}'
+    copy = os.path.join(directory, f'{name}.db.partial')
+    archive = os.path.join(directory, name + SUFFIX)
+    try:
+        source = sqlite3.connect(f'file:{path}?mode=ro', uri=True, isolation_level=None)
+        try:
+            source.execute('BEGIN')
+            source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+            target = sqlite3.connect(copy)
+            try:
+                source.backup(target, pages=pages,
+                              progress=(lambda *_: time.sleep(step_delay)) if step_delay else None)
+            finally:
+                target.close()
+            source.execute('COMMIT')
+        finally:
+            source.close()
+
+        with open(copy, 'rb') as f_in, gzip.open(archive + '.partial', 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1 << 20)
+        os.replace(archive + '.partial', archive)
+        return archive
+    finally:
+        for leftover in (copy, archive + '.partial'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def prune_backups(path: str, directory: str, keep: int) -> List[str]:
+    # Deletes all but the newest keep snapshots of the database at path;
+    # returns the deleted files. Timestamps in the names sort by age.
+    prefix = _stem(path) + '-'
+    try:
+        snapshots = sorted(name for name in os.listdir(directory)
+                           if name.startswith(prefix) and name.endswith(SUFFIX))
+    except FileNotFoundError:
+        return []
+    removed = []
+    for name in snapshots[:max(0, len(snapshots) - keep)]:
+        os.remove(os.path.join(directory, name))
+        removed.append(name)
+    return removed
@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+MAX_OPTIONS = 25  # Discord's limit for options in one select
+MAX_NAME_LENGTH = 100  # and for the length of an option label
+
+
+class CatalogError(ValueError):
+    pass
+
+
+class CatalogConfig:
+    # The game catalog as configured in the catalog file (catalog.json): game
+    # modes, their regions and servers, dinosaurs by type and genders, all in
+    # display order. Immutable once built, so a reload can swap in a new one
+    # while menus are still reading the old one.
+    def __init__(self, game_modes: Sequence[str], servers_by_mode: Mapping[str, Mapping[str, Sequence[str]]],
+                 dinosaurs: Mapping[str, Sequence[str]], genders: Sequence[str], mtime: int = 0):
+        self.game_modes = tuple(game_modes)
+        self.servers_by_mode = MappingProxyType({
+            mode: MappingProxyType({region: tuple(servers) for region, servers in servers_by_mode[mode].items()})
+            for mode in self.game_modes
+        })
+        self.dinosaurs = MappingProxyType({dino_type: tuple(dinos) for dino_type, dinos in dinosaurs.items()})
+        self.genders = tuple(genders)
+        self.mtime = mtime
+        self.server_regions = MappingProxyType({
+            (mode, server): region
+            for mode, regions in self.servers_by_mode.items()
+            for region, servers in regions.items()
+            for server in servers
+        })
+        self.dinosaur_types = MappingProxyType({
+            dino: dino_type for dino_type, dinos in self.dinosaurs.items() for dino in dinos
+        })
+        # "Game mode · region" choices, for a menu that picks both at once;
+        # empty when they don't fit in one select
+        places = {
+            f"{mode} · {region}": (mode, region)
+            for mode, regions in self.servers_by_mode.items()
+            for region in regions
+        }
+        fits = (len(places) == sum(len(regions) for regions in self.servers_by_mode.values())
+                and len(places) <= MAX_OPTIONS and all(len(place) <= MAX_NAME_LENGTH for place in places))
+        self.places = MappingProxyType(places if fits else {})
+        self._place_names = {where: place for place, where in self.places.items()}
+
+    def regions(self, game_mode: str) -> Tuple[str, ...]:
+        return tuple(self.servers_by_mode.get(game_mode, ()))
+
+    def servers(self, game_mode: str, region: str) -> Tuple[str, ...]:
+        return self.servers_by_mode.get(game_mode, {}).get(region, ())
+
+    def place(self, game_mode: str, region: str) -> Optional[str]:
+        return self._place_names.get((game_mode, region))
+
+
+def _names(value, what: str, unique: bool = True) -> list:
+    if not isinstance(value, list) or not value:
+        raise CatalogError(f"{what} must be a non-empty list")
+    if len(value) > MAX_OPTIONS:
+        raise CatalogError(f"{what} has {len(value)} entries; a menu can show at most {MAX_OPTIONS}")
+    for name in value:
+        if not isinstance(name, str) or not name.strip() or len(name) > MAX_NAME_LENGTH:
+            raise CatalogError(f"{what}: {name!r} is not a name of 1 to {MAX_NAME_LENGTH} characters")
+    if unique and len(set(value)) != len(value):
+        raise CatalogError(f"{what} has duplicate names")
+    return value
+
+
+def _groups(value, what: str) -> dict:
+    if not isinstance(value, dict) or not value:
+        raise CatalogError(f"{what} must be a non-empty object")
+    _names(list(value), what)
+    return value
+
+
+def parse_catalog_config(data, mtime: int = 0) -> CatalogConfig:
+    # Validates the catalog file's contents:
+    #   {"genders": [...], "game_modes": [...],
+    #    "servers": {mode: {region: [server, ...]}}, "dinosaurs": {type: [dino, ...]}}
+    if not isinstance(data, dict):
+        raise CatalogError("the catalog must be a JSON object")
+    missing = {"genders", "game_modes", "servers", "dinosaurs"} - data.keys()
+    if missing:
+        raise CatalogError(f"missing keys: {', '.join(sorted(missing))}")
+
+    genders = _names(data["genders"], "genders")
+    game_modes = _names(data["game_modes"], "game_modes")
+    servers_by_mode = _groups(data["servers"], "servers")
+    if set(servers_by_mode) != set(game_modes):
+        raise CatalogError("servers must list regions for exactly the game modes in game_modes")
+    for mode, regions in servers_by_mode.items():
+        _groups(regions, f"regions of {mode}")
+        # Server names are unique per game mode, not just per region
+        servers = [server for region, names in regions.items()
+                   for server in _names(names, f"servers of {mode} / {region}")]
+        if len(set(servers)) != len(servers):
+            raise CatalogError(f"{mode} lists a server in more than one region")
+    dinosaurs = _groups(data["dinosaurs"], "dinosaurs")
+    names = [dino for dino_type, dinos in dinosaurs.items() for dino in _names(dinos, f"dinosaurs of {dino_type}")]
+    if len(set(names)) != len(names):
+        raise CatalogError("a dinosaur is listed under more than one type")
+
+    return CatalogConfig(game_modes, servers_by_mode, dinosaurs, genders, mtime)
+
+
+def load_catalog_config(path: str) -> CatalogConfig:
+    # Raises OSError if the file can't be read and CatalogError if it isn't a
+    # valid catalog
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f"not valid JSON: {e}") from e
+    return parse_catalog_config(data, mtime)
+
+
+class Catalog:
+    # Name <-> integer ID lookups for the catalog tables. dino_records only
+    # stores the IDs; everything shown to users is mapped back through here.
+    def __init__(self, game_modes: Dict[str, int], servers: Dict[int, Tuple[str, Optional[str], str]],
+                 dinosaurs: Dict[str, int], genders: Dict[str, int]):
+        self.game_mode_ids = game_modes
+        self.servers = servers
+        self.server_ids = {(mode, name): server_id for server_id, (mode, _, name) in servers.items()}
+        self.dinosaur_ids = dinosaurs
+        self.dinosaur_names = {dinosaur_id: name for name, dinosaur_id in dinosaurs.items()}
+        self.gender_ids = genders
+        self.gender_names = {gender_id: name for name, gender_id in genders.items()}
+
+    def server_id(self, game_mode: str, server: str) -> int:
+        return self.server_ids[(game_mode, server)]
+
+    def server(self, server_id: int) -> Tuple[str, Optional[str], str]:
+        # (game mode, region, server name)
+        return self.servers[server_id]
+
+
+def sync_catalog(conn: sqlite3.Connection, game_modes, servers_by_mode, dinosaurs, genders) -> Catalog:
+    # Makes sure every catalog entry has a row (IDs of existing entries never
+    # change) and returns the lookups for the whole table contents.
+    conn.executemany('''
+        INSERT INTO game_modes (name) VALUES (?)
+        ON CONFLICT (name) DO NOTHING
+    ''', [(mode,) for mode in game_modes])
+    conn.executemany('''
+        INSERT INTO servers (game_mode_id, region, name)
+        VALUES ((SELECT id FROM game_modes WHERE name = ?), ?, ?)
+        ON CONFLICT (game_mode_id, name) DO UPDATE SET region = excluded.region
+    ''', [
+        (mode, region, server)
+        for mode, regions in servers_by_mode.items()
+        for region, servers in regions.items()
+        for server in servers
+    ])
+    conn.executemany('''
+        INSERT INTO dinosaurs (dino_type, name) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET dino_type = excluded.dino_type
+    ''', [(dino_type, dino) for dino_type, dinos in dinosaurs.items() for dino in dinos])
+    conn.executemany('''
+        INSERT INTO genders (name) VALUES (?)
+        ON CONFLICT (name) DO NOTHING
+    ''', [(gender,) for gender in genders])
+
+    return load_catalog(conn)
+
+
+def load_catalog(conn: sqlite3.Connection) -> Catalog:
+    servers = {
+        server_id: (mode, region, name)
+        for server_id, mode, region, name in conn.execute('''
+            SELECT servers.id, game_modes.name, servers.region, servers.name
+            FROM servers JOIN game_modes ON game_modes.id = servers.game_mode_id
+        ''')
+    }
+    return Catalog(
+        game_modes={name: mode_id for mode_id, name in conn.execute('SELECT id, name FROM game_modes')},
+        servers=servers,
+        dinosaurs={name: dinosaur_id for dinosaur_id, name in conn.execute('SELECT id, name FROM dinosaurs')},
+        genders={name: gender_id for gender_id, name in conn.execute('SELECT id, name FROM genders')},
+    )
+
+
+def account_id(conn: sqlite3.Connection, name: str) -> int:
+    # Interns an account name, returning its ID.
+    conn.execute('INSERT INTO account_names (name) VALUES (?) ON CONFLICT (name) DO NOTHING', (name,))
+    return conn.execute('SELECT id FROM account_names WHERE name = ?', (name,)).fetchone()[0]
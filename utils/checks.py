@@ -0,0 +1,8 @@
+import discord
+from discord import app_commands
+
+
+def is_owner():
+    async def predicate(interaction: discord.Interaction):
+        return await interaction.client.is_owner(interaction.user)
+    return app_commands.check(predicate)
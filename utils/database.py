@@ -0,0 +1,234 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import metrics
+
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,        # ~16 MB page cache per connection
+    'mmap_size': 268435456,      # 256 MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
+
+class Database:
+    # Shared connection manager. One writer connection lives on its own thread
+    # and serialises every write; a small pool of read-only connections serves
+    # queries concurrently. WAL journaling lets readers proceed while a write
+    # is being committed, so reads never wait behind writes.
+    #
+    # Writes are group-committed: they queue up and the writer applies
+    # everything that arrives within batch_window seconds (up to max_batch
+    # writes) in one transaction, each write in its own savepoint, then
+    # resolves every caller once that transaction has been durably committed.
+    def __init__(self, path: str, readers: int = 4, batch_window: float = 0.002, max_batch: int = 128):
+        self.path = path
+        self.readers = readers if path != ':memory:' else 0
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue = None
+        self._write_task = None
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dino-db-writer')
+        self._reader_executor = None
+        if self.readers:
+            self._reader_executor = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='dino-db-reader')
+        self._writer = None
+        self._local = threading.local()
+        self._reader_conns = []
+        self._reader_lock = threading.Lock()
+
+    @staticmethod
+    def _apply_pragmas(conn):
+        for name, value in PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        if self._writer is None:
+            self._writer = sqlite3.connect(self.path)
+            if self._writer.execute('PRAGMA page_count').fetchone()[0] == 0:
+                # Only takes on a brand-new file, before WAL mode writes its
+                # first page; existing files are switched over offline (see
+                # utils/schema.py). Setting it needs the write lock, so it's
+                # skipped for files that already exist.
+                self._writer.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            if self.path != ':memory:':
+                self._writer.execute('PRAGMA journal_mode = WAL')
+            self._apply_pragmas(self._writer)
+            # Batching amortises the fsync, so every commit can afford to be durable
+            self._writer.execute('PRAGMA synchronous = FULL')
+        return self._writer
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Each reader connection is only used by the thread that opened it;
+            # the flag just allows close() to tidy them up from elsewhere.
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._apply_pragmas(conn)
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    async def _write(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer_executor, func, *args)
+
+    async def _read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            if self._reader_executor is None:
+                return await loop.run_in_executor(self._writer_executor, self._on_writer, func, *args)
+            return await loop.run_in_executor(self._reader_executor, self._on_reader, func, *args)
+        finally:
+            metrics.add_db_time(time.perf_counter() - start)
+
+    def _on_writer(self, func, *args):
+        return func(self._writer_connection(), *args)
+
+    def _on_reader(self, func, *args):
+        return func(self._reader_connection(), *args)
+
+    @staticmethod
+    def _fetchone(conn, sql, params):
+        return conn.execute(sql, params).fetchone()
+
+    @staticmethod
+    def _fetchall(conn, sql, params):
+        return conn.execute(sql, params).fetchall()
+
+    def _commit_batch(self, funcs):
+        conn = self._writer_connection()
+        results = []
+        try:
+            # Inside the try: BEGIN fails with "database is locked" when
+            # another process holds the write lock past busy_timeout
+            conn.execute('BEGIN IMMEDIATE')
+            for func in funcs:
+                conn.execute('SAVEPOINT write')
+                try:
+                    results.append((True, func(conn)))
+                    conn.execute('RELEASE write')
+                except Exception as e:
+                    # Only this write is undone; the rest of the batch commits
+                    conn.execute('ROLLBACK TO write')
+                    conn.execute('RELEASE write')
+                    results.append((False, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                try:
+                    conn.execute('ROLLBACK')
+                except sqlite3.Error:
+                    pass
+            return [(False, e)] * len(funcs)
+        return results
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.batch_window
+            closing = False
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            try:
+                results = await self._write(self._commit_batch, [func for func, _ in batch])
+            except Exception as e:
+                # Fail this batch but keep the writer running for the next one
+                print(f"Error committing write batch: {e}")
+                results = [(False, e)] * len(batch)
+            for (_, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            if closing:
+                return
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _close_readers(self):
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+
+    async def connect(self):
+        # Opening the writer first creates the file and switches it to WAL
+        # before any read-only connection is attempted.
+        await self._write(self._writer_connection)
+        self._queue = asyncio.Queue()
+        self._write_task = asyncio.create_task(self._write_loop())
+
+    async def run(self, func):
+        # func receives the writer connection and runs on the writer thread
+        # outside the write queue, managing its own transactions. Meant for
+        # startup work such as migrations.
+        return await self._write(self._on_writer, func)
+
+    async def execute(self, sql: str, params=()) -> int:
+        return await self.transaction(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self._read(self._fetchone, sql, params)
+
+    async def fetchall(self, sql: str, params=()):
+        return await self._read(self._fetchall, sql, params)
+
+    async def read(self, func):
+        # func receives a read-only connection and runs on a reader thread.
+        return await self._read(func)
+
+    async def transaction(self, func):
+        # func receives the writer connection and runs on the writer thread;
+        # everything it does is committed together, or rolled back if it
+        # raises. Resolves once the batch it joined has been committed.
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((func, future))
+        start = time.perf_counter()
+        try:
+            return await future
+        finally:
+            # Includes the wait for the batch to commit, which is part of
+            # what the caller pays for the write
+            metrics.add_db_time(time.perf_counter() - start)
+
+    async def close(self):
+        if self._write_task is not None:
+            self._queue.put_nowait(None)
+            await self._write_task
+            self._write_task = None
+        if self._reader_executor is not None:
+            self._reader_executor.shutdown(wait=True)
+            self._close_readers()
+        await self._write(self._close_writer)
+        self._writer_executor.shutdown(wait=False)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import secrets
+import time
+from typing import Callable, Dict, Optional
+
+import discord
+
+from utils.metrics import metrics
+
+CUSTOM_ID_PREFIX = 'dino'
+
+
+def select_options(values, selected=None, labels=None, descriptions=None):
+    labels = labels or {}
+    descriptions = descriptions or {}
+    return [
+        discord.SelectOption(label=labels.get(value, value), value=value, description=descriptions.get(value),
+                             default=(value == selected))
+        for value in values
+    ]
+
+
+class Session:
+    # A multi-step UI bound to one user. Its state lives in the ui_sessions
+    # table, not in memory: every component and modal it renders carries a
+    # stable custom_id "dino:<kind>:<session id>:<action>", and a click or
+    # modal submit rebuilds the session from its stored state, so sessions
+    # survive restarts and cost nothing while idle. Subclasses list their
+    # persisted attributes in `fields` and accept them as keyword arguments.
+    kind = 'session'
+    fields = ()
+    timeout = 180
+
+    def __init__(self, user_id: int, session_id: Optional[str] = None):
+        self.user_id = user_id
+        self.session_id = session_id or secrets.token_hex(8)
+        self.closed = False
+
+    def state(self) -> dict:
+        return {field: getattr(self, field) for field in self.fields}
+
+    def custom_id(self, action: str) -> str:
+        return f'{CUSTOM_ID_PREFIX}:{self.kind}:{self.session_id}:{action}'
+
+    def select(self, action: str, placeholder: str, values=(), selected=None, row=None, labels=None,
+               options=None) -> discord.ui.Select:
+        # options, if given, is a ready-made list (see utils/render_cache.py)
+        return discord.ui.Select(
+            custom_id=self.custom_id(action),
+            placeholder=placeholder,
+            options=options if options is not None else select_options(values, selected, labels),
+            row=row
+        )
+
+    def button(self, action: str, label: str, style=discord.ButtonStyle.grey, row=None, disabled=False) -> discord.ui.Button:
+        return discord.ui.Button(custom_id=self.custom_id(action), label=label, style=style, row=row, disabled=disabled)
+
+    def modal(self, action: str, title: str, *items) -> discord.ui.Modal:
+        # Render-only like view(): a stopped modal isn't tracked by discord.py
+        modal = discord.ui.Modal(title=title, timeout=None, custom_id=self.custom_id(action))
+        for item in items:
+            modal.add_item(item)
+        modal.stop()
+        return modal
+
+    @staticmethod
+    def submitted(interaction: discord.Interaction) -> Dict[str, str]:
+        # Values of a modal submit, by text input custom_id
+        return {
+            component['custom_id']: component.get('value', '')
+            for row in (interaction.data or {}).get('components', [])
+            for component in row.get('components', [])
+        }
+
+    @staticmethod
+    def view(*items) -> discord.ui.View:
+        # Render-only view: it is stopped up front so discord.py doesn't track
+        # it or start a timeout task for it; clicks go through the dispatcher.
+        view = discord.ui.View(timeout=None)
+        for item in items:
+            view.add_item(item)
+        view.stop()
+        return view
+
+    def close(self):
+        self.closed = True
+
+    async def handle(self, interaction: discord.Interaction, action: str):
+        raise NotImplementedError
+
+
+class InteractionDispatcher:
+    # Routes component and modal interactions to their session kind with one dict
+    # lookup, then loads that session's state with one primary-key read.
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, db):
+        self.db = db
+        self._factories: Dict[str, Callable[..., Session]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def register(self, kind: str, factory: Callable[..., Session]):
+        # factory(user_id, session_id=..., **state) rebuilds a session
+        self._factories[kind] = factory
+
+    def unregister(self, kind: str):
+        self._factories.pop(kind, None)
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def open(self, session: Session) -> Session:
+        await self.db.execute('''
+            INSERT INTO ui_sessions (session_id, kind, user_id, state, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (session.session_id, session.kind, session.user_id,
+              json.dumps(session.state()), time.time() + session.timeout))
+        return session
+
+    async def _save(self, session: Session):
+        if session.closed:
+            await self.db.execute('DELETE FROM ui_sessions WHERE session_id = ?', (session.session_id,))
+        else:
+            await self.db.execute('''
+                UPDATE ui_sessions SET state = ?, expires_at = ?
+                WHERE session_id = ?
+            ''', (json.dumps(session.state()), time.time() + session.timeout, session.session_id))
+
+    async def _load(self, kind: str, session_id: str) -> Optional[Session]:
+        row = await self.db.fetchone('''
+            SELECT user_id, state FROM ui_sessions
+            WHERE session_id = ? AND kind = ? AND expires_at > ?
+        ''', (session_id, kind, time.time()))
+        if row is None:
+            return None
+        user_id, state = row
+        return self._factories[kind](user_id, session_id=session_id, **json.loads(state))
+
+    async def dispatch(self, interaction: discord.Interaction):
+        if interaction.type not in (discord.InteractionType.component, discord.InteractionType.modal_submit):
+            return
+        custom_id = (interaction.data or {}).get('custom_id', '')
+        parts = custom_id.split(':', 3)
+        if len(parts) != 4 or parts[0] != CUSTOM_ID_PREFIX or parts[1] not in self._factories:
+            return
+        _, kind, session_id, action = parts
+
+        with metrics.span(f'{kind}:{action}'):
+            await self._dispatch(interaction, kind, session_id, action)
+
+    async def _dispatch(self, interaction: discord.Interaction, kind: str, session_id: str, action: str):
+        # Clicks on the same session are applied one at a time so each sees
+        # the state the previous one saved.
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._lock_users[session_id] = self._lock_users.get(session_id, 0) + 1
+        try:
+            async with lock:
+                session = await self._load(kind, session_id)
+                if session is None:
+                    expired = "This menu has expired. Please run the command again."
+                    if interaction.message is None:
+                        # A modal opened straight from a command has no message to edit
+                        await interaction.response.send_message(expired, ephemeral=True)
+                    else:
+                        await interaction.response.edit_message(content=expired, embed=None, view=None)
+                    return
+                if interaction.user.id != session.user_id:
+                    await interaction.response.send_message("This menu isn't yours.", ephemeral=True)
+                    return
+
+                try:
+                    await session.handle(interaction, action)
+                finally:
+                    await self._save(session)
+        finally:
+            self._lock_users[session_id] -= 1
+            if not self._lock_users[session_id]:
+                del self._lock_users[session_id]
+                del self._locks[session_id]
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            try:
+                await self.db.execute('DELETE FROM ui_sessions WHERE expires_at <= ?', (time.time(),))
+            except Exception as e:
+                print(f"Error expiring UI sessions: {e}")
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import secrets
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class EventBus:
+    # Cache invalidation between bot processes that share the database.
+    # Writers publish an event in the same transaction as the change it
+    # describes; every process polls PRAGMA data_version on its writer
+    # connection (it only changes when another connection commits), and
+    # when it moves, reads the new events and hands them to subscribers.
+    # A process skips its own events, having already applied them locally.
+    #
+    # Subscribers get the event payload, or None when events were pruned
+    # before this process read them and it should drop its caches instead.
+    # Disabled (publish does nothing) when only one process is running.
+    RETENTION = 300
+
+    def __init__(self, db, enabled: bool = False, poll_interval: float = 1.0, prune: bool = True):
+        self.db = db
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self.prune = prune
+        self.origin = secrets.token_hex(8)
+        self._subscribers: Dict[str, List[Callable[[Optional[dict]], None]]] = {}
+        self._last_id = 0
+        self._data_version = None
+        self._poller: Optional[asyncio.Task] = None
+
+    def subscribe(self, topic: str, callback: Callable[[Optional[dict]], None]):
+        self._subscribers.setdefault(topic, []).append(callback)
+
+    def unsubscribe(self, topic: str, callback: Callable[[Optional[dict]], None]):
+        callbacks = self._subscribers.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, conn, topic: str, payload: dict):
+        # Call from inside a write transaction
+        if not self.enabled:
+            return
+        conn.execute('''
+            INSERT INTO cache_events (origin, topic, payload, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (self.origin, topic, json.dumps(payload), time.time()))
+
+    async def start(self):
+        if not self.enabled or self._poller is not None:
+            return
+        row = await self.db.fetchone('SELECT MAX(id) FROM cache_events')
+        self._last_id = row[0] or 0
+        self._data_version = await self.db.run(self._read_data_version)
+        self._poller = asyncio.create_task(self._poll())
+
+    def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    @staticmethod
+    def _read_data_version(conn) -> int:
+        return conn.execute('PRAGMA data_version').fetchone()[0]
+
+    async def _poll(self):
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                data_version = await self.db.run(self._read_data_version)
+                if data_version != self._data_version:
+                    self._data_version = data_version
+                    await self._deliver()
+                if self.prune and time.monotonic() - last_prune >= self.RETENTION / 2:
+                    last_prune = time.monotonic()
+                    await self.db.execute('DELETE FROM cache_events WHERE created_at < ?',
+                                          (time.time() - self.RETENTION,))
+            except Exception as e:
+                print(f"Error polling cache events: {e}")
+
+    async def _deliver(self):
+        rows = await self.db.fetchall('''
+            SELECT id, origin, topic, payload FROM cache_events
+            WHERE id > ? ORDER BY id
+        ''', (self._last_id,))
+        if not rows:
+            return
+
+        if rows[0][0] > self._last_id + 1:
+            # IDs can skip when a write rolls back, so only treat this as
+            # missed events if the ones after our last were pruned.
+            oldest = await self.db.fetchone('SELECT MIN(id) FROM cache_events')
+            if oldest[0] is not None and oldest[0] > self._last_id + 1:
+                for callbacks in self._subscribers.values():
+                    for callback in callbacks:
+                        callback(None)
+
+        for event_id, origin, topic, payload in rows:
+            self._last_id = event_id
+            if origin == self.origin:
+                continue
+            for callback in self._subscribers.get(topic, []):
+                callback(json.loads(payload))
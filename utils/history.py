@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+# (bucket size, how long buckets of that size are kept) in seconds, finest
+# first. Buckets that age out of one level are summed into the next one, so
+# storage stays bounded however long the bot runs.
+RESOLUTIONS = (
+    (60, 2 * 86400),
+    (3600, 30 * 86400),
+    (86400, 365 * 86400),
+)
+
+
+def record_population_sample(conn, now: float):
+    # Adds the current server_population totals (nested and not combined) to
+    # the finest bucket containing now.
+    resolution = RESOLUTIONS[0][0]
+    bucket = int(now // resolution) * resolution
+    conn.execute('''
+        INSERT INTO population_history_buckets (resolution, bucket, samples)
+        VALUES (?, ?, 1)
+        ON CONFLICT (resolution, bucket) DO UPDATE SET samples = samples + 1
+    ''', (resolution, bucket))
+    conn.execute('''
+        INSERT INTO population_history (resolution, server_id, bucket, dinosaur_id, total)
+        SELECT ?, server_id, ?, dinosaur_id, SUM(count)
+        FROM server_population
+        WHERE count > 0
+        GROUP BY server_id, dinosaur_id
+        ON CONFLICT (resolution, server_id, bucket, dinosaur_id) DO UPDATE SET total = total + excluded.total
+    ''', (resolution, bucket))
+
+
+def rollup_population_history(conn, now: float) -> int:
+    # Moves buckets past their level's retention into the next level and
+    # drops the oldest level's expired buckets. Cutoffs are aligned to the
+    # next level's bucket size, so a coarse bucket is filled in one pass.
+    moved = 0
+    for (resolution, keep), (coarser, _) in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+        cutoff = int((now - keep) // coarser) * coarser
+        conn.execute('''
+            INSERT INTO population_history_buckets (resolution, bucket, samples)
+            SELECT ?, bucket / ? * ?, SUM(samples)
+            FROM population_history_buckets
+            WHERE resolution = ? AND bucket < ?
+            GROUP BY bucket / ?
+            ON CONFLICT (resolution, bucket) DO UPDATE SET samples = samples + excluded.samples
+        ''', (coarser, coarser, coarser, resolution, cutoff, coarser))
+        conn.execute('''
+            INSERT INTO population_history (resolution, server_id, bucket, dinosaur_id, total)
+            SELECT ?, server_id, bucket / ? * ?, dinosaur_id, SUM(total)
+            FROM population_history
+            WHERE resolution = ? AND bucket < ?
+            GROUP BY server_id, bucket / ?, dinosaur_id
+            ON CONFLICT (resolution, server_id, bucket, dinosaur_id) DO UPDATE SET total = total + excluded.total
+        ''', (coarser, coarser, coarser, resolution, cutoff, coarser))
+        moved += _delete_before(conn, resolution, cutoff)
+
+    resolution, keep = RESOLUTIONS[-1]
+    _delete_before(conn, resolution, int(now - keep))
+    return moved
+
+
+def _delete_before(conn, resolution: int, cutoff: int) -> int:
+    conn.execute('DELETE FROM population_history WHERE resolution = ? AND bucket < ?', (resolution, cutoff))
+    return conn.execute('''
+        DELETE FROM population_history_buckets WHERE resolution = ? AND bucket < ?
+    ''', (resolution, cutoff)).rowcount
+
+
+def load_trend(conn, server_id: int, since: float, step: int):
+    # Average count per dinosaur in each step-sized bucket from since onwards,
+    # built from whichever levels cover that range (all no coarser than
+    # step). Returns (bucket starts, {dinosaur_id: [average per bucket]});
+    # buckets with no samples at all are left out.
+    levels = [resolution for resolution, _ in RESOLUTIONS if resolution <= step]
+    placeholders = ", ".join("?" for _ in levels)
+    start = int(since // step) * step
+
+    samples = dict(conn.execute(f'''
+        SELECT bucket / ? * ?, SUM(samples)
+        FROM population_history_buckets
+        WHERE resolution IN ({placeholders}) AND bucket >= ?
+        GROUP BY bucket / ?
+    ''', (step, step, *levels, start, step)))
+    buckets = sorted(samples)
+    index = {bucket: i for i, bucket in enumerate(buckets)}
+
+    series = defaultdict(lambda: [0.0] * len(buckets))
+    for bucket, dinosaur_id, total in conn.execute(f'''
+        SELECT bucket / ? * ?, dinosaur_id, SUM(total)
+        FROM population_history
+        WHERE resolution IN ({placeholders}) AND server_id = ? AND bucket >= ?
+        GROUP BY bucket / ?, dinosaur_id
+    ''', (step, step, *levels, server_id, start, step)):
+        if bucket in index:
+            series[dinosaur_id][index[bucket]] = total / samples[bucket]
+    return buckets, dict(series)
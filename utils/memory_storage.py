@@ -0,0 +1,217 @@
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.catalog import Catalog
+from utils.history import RESOLUTIONS
+from utils.storage import PopulationKey, Record, Storage
+
+
+class MemoryStorage(Storage):
+    # Pure in-memory Storage: nothing survives a restart and nothing is
+    # shared between processes. Records are indexed by ID, by (user,
+    # account, server) and by (user, account), archived records included;
+    # the ID index of live records is kept in update order, so expiry only
+    # ever looks at the oldest records.
+    def __init__(self):
+        self._game_modes: Dict[str, int] = {}
+        self._servers: Dict[Tuple[int, str], int] = {}
+        self._server_rows: Dict[int, Tuple[str, Optional[str], str]] = {}
+        self._dinosaurs: Dict[str, int] = {}
+        self._genders: Dict[str, int] = {}
+
+        self._next_id = 1
+        self._records: OrderedDict = OrderedDict()  # id -> [discord_id, account, server_id, dinosaur_id, gender_id, is_nested, date_updated]
+        self._record_ids: Dict[Tuple[int, str, int], int] = {}  # live and archived
+        self._owner_ids: Dict[Tuple[int, str], set] = defaultdict(set)
+        self._archive: Dict[int, list] = {}
+        self._population: Counter = Counter()
+
+        self._settings: Dict[int, List] = {}
+        self._alts: Dict[int, List[str]] = defaultdict(list)
+
+        self._buckets: Counter = Counter()  # (resolution, bucket) -> samples
+        self._history: Counter = Counter()  # (resolution, server_id, bucket, dinosaur_id) -> total
+
+    async def sync_catalog(self, game_modes, servers_by_mode, dinosaurs, genders) -> Catalog:
+        for mode in game_modes:
+            self._game_modes.setdefault(mode, len(self._game_modes) + 1)
+        for mode, regions in servers_by_mode.items():
+            mode_id = self._game_modes.setdefault(mode, len(self._game_modes) + 1)
+            for region, servers in regions.items():
+                for server in servers:
+                    server_id = self._servers.setdefault((mode_id, server), len(self._servers) + 1)
+                    self._server_rows[server_id] = (mode, region, server)
+        for dinos in dinosaurs.values():
+            for dino in dinos:
+                self._dinosaurs.setdefault(dino, len(self._dinosaurs) + 1)
+        for gender in genders:
+            self._genders.setdefault(gender, len(self._genders) + 1)
+        return Catalog(dict(self._game_modes), dict(self._server_rows), dict(self._dinosaurs), dict(self._genders))
+
+    async def save_record(self, discord_id: int, account_name: str, server_id: int, dinosaur_id: int,
+                          gender_id: int, is_nested: bool) -> Optional[PopulationKey]:
+        is_nested = int(is_nested)
+        key = (discord_id, account_name, server_id)
+        now = str(datetime.now())
+        previous = None
+        record_id = self._record_ids.get(key)
+        if record_id in self._archive:
+            # Replaced by a new live record, as in SQLiteStorage
+            del self._archive[record_id]
+            self._owner_ids[(discord_id, account_name)].discard(record_id)
+            record_id = None
+        if record_id is None:
+            record_id = self._next_id
+            self._next_id += 1
+            self._record_ids[key] = record_id
+            self._owner_ids[(discord_id, account_name)].add(record_id)
+        else:
+            previous = self._population_key(self._records.pop(record_id))
+            self._population[previous] -= 1
+
+        record = [discord_id, account_name, server_id, dinosaur_id, gender_id, is_nested, now]
+        self._records[record_id] = record
+        self._population[self._population_key(record)] += 1
+        return previous
+
+    @staticmethod
+    def _population_key(record) -> PopulationKey:
+        return record[2], record[3], record[5]
+
+    async def get_record(self, record_id: int) -> Optional[Record]:
+        record = self._records.get(record_id)
+        if record is not None:
+            return (*record[2:], False)
+        record = self._archive.get(record_id)
+        return record and (*record[2:], True)
+
+    async def count_records(self, discord_id: int, account_name: str) -> int:
+        return len(self._owner_ids.get((discord_id, account_name), ()))
+
+    async def record_page(self, discord_id: int, account_name: str, after: Optional[list],
+                          limit: int) -> List[Tuple[int, str]]:
+        keys = sorted(
+            (((self._records.get(record_id) or self._archive[record_id])[6], record_id)
+             for record_id in self._owner_ids.get((discord_id, account_name), ())),
+            reverse=True
+        )
+        if after is not None:
+            after = tuple(after)
+            keys = [key for key in keys if key < after]
+        return [(record_id, date_updated) for date_updated, record_id in keys[:limit]]
+
+    async def expire_records(self, cutoff: datetime, limit: int) -> List[PopulationKey]:
+        cutoff = str(cutoff)
+        expired = []
+        while self._records and len(expired) < limit:
+            record_id, record = next(iter(self._records.items()))
+            if record[6] >= cutoff:
+                break
+            del self._records[record_id]
+            self._archive[record_id] = record
+            key = self._population_key(record)
+            self._population[key] -= 1
+            if self._population[key] <= 0:
+                del self._population[key]
+            expired.append(key)
+        return expired
+
+    async def purge_archive(self, cutoff: datetime, limit: int) -> int:
+        cutoff = str(cutoff)
+        purged = [record_id for record_id, record in self._archive.items() if record[6] < cutoff][:limit]
+        for record_id in purged:
+            discord_id, account_name, server_id = self._archive.pop(record_id)[:3]
+            del self._record_ids[(discord_id, account_name, server_id)]
+            owned = self._owner_ids[(discord_id, account_name)]
+            owned.discard(record_id)
+            if not owned:
+                del self._owner_ids[(discord_id, account_name)]
+        return len(purged)
+
+    async def get_settings(self, discord_id: int) -> Optional[Tuple[bool, int]]:
+        settings = self._settings.get(discord_id)
+        return settings and (settings[0], settings[1])
+
+    async def set_alt_accounts_enabled(self, discord_id: int, enabled: bool):
+        self._settings[discord_id] = [bool(enabled), 0]
+
+    async def set_num_alt_accounts(self, discord_id: int, count: int, clear: bool = False):
+        if discord_id in self._settings:
+            self._settings[discord_id][1] = count
+        if clear:
+            self._alts.pop(discord_id, None)
+
+    async def add_alt_account(self, discord_id: int, name: str):
+        self._alts[discord_id].append(name)
+
+    async def set_alt_accounts(self, discord_id: int, names: Sequence[str]):
+        if discord_id in self._settings:
+            self._settings[discord_id][1] = len(names)
+        self._alts[discord_id] = list(names)
+
+    async def list_alt_accounts(self, discord_id: int) -> List[str]:
+        return list(self._alts.get(discord_id, ()))
+
+    async def population(self, server_ids: Sequence[int]) -> Dict[int, Counter]:
+        counts = {server_id: Counter() for server_id in server_ids}
+        for (server_id, dinosaur_id, is_nested), count in self._population.items():
+            if server_id in counts and count > 0:
+                counts[server_id][(dinosaur_id, is_nested)] = count
+        return counts
+
+    def _recount(self) -> Counter:
+        return Counter(self._population_key(record) for record in self._records.values())
+
+    async def count_population_mismatches(self) -> int:
+        actual = self._recount()
+        stored = +self._population
+        return sum(1 for key in actual.keys() | stored.keys() if actual[key] != stored[key])
+
+    async def rebuild_population(self) -> int:
+        self._population = self._recount()
+        return len(self._population)
+
+    async def record_population_sample(self, now: float):
+        resolution = RESOLUTIONS[0][0]
+        bucket = int(now // resolution) * resolution
+        self._buckets[(resolution, bucket)] += 1
+        for (server_id, dinosaur_id, _), count in self._population.items():
+            if count > 0:
+                self._history[(resolution, server_id, bucket, dinosaur_id)] += count
+
+    async def rollup_population_history(self, now: float):
+        for (resolution, keep), (coarser, _) in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+            cutoff = int((now - keep) // coarser) * coarser
+            for key in [key for key in self._buckets if key[0] == resolution and key[1] < cutoff]:
+                self._buckets[(coarser, key[1] // coarser * coarser)] += self._buckets.pop(key)
+            for key in [key for key in self._history if key[0] == resolution and key[2] < cutoff]:
+                _, server_id, bucket, dinosaur_id = key
+                self._history[(coarser, server_id, bucket // coarser * coarser, dinosaur_id)] += self._history.pop(key)
+
+        resolution, keep = RESOLUTIONS[-1]
+        cutoff = int(now - keep)
+        for key in [key for key in self._buckets if key[0] == resolution and key[1] < cutoff]:
+            del self._buckets[key]
+        for key in [key for key in self._history if key[0] == resolution and key[2] < cutoff]:
+            del self._history[key]
+
+    async def load_trend(self, server_id: int, since: float, step: int):
+        levels = {resolution for resolution, _ in RESOLUTIONS if resolution <= step}
+        start = int(since // step) * step
+        samples = Counter()
+        for (resolution, bucket), count in self._buckets.items():
+            if resolution in levels and bucket >= start:
+                samples[bucket // step * step] += count
+        buckets = sorted(samples)
+        index = {bucket: i for i, bucket in enumerate(buckets)}
+
+        totals = Counter()
+        for (resolution, history_server, bucket, dinosaur_id), total in self._history.items():
+            if resolution in levels and history_server == server_id and bucket >= start:
+                totals[(bucket // step * step, dinosaur_id)] += total
+
+        series = {}
+        for (bucket, dinosaur_id), total in totals.items():
+            series.setdefault(dinosaur_id, [0.0] * len(buckets))[index[bucket]] = total / samples[bucket]
+        return buckets, series
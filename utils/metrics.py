@@ -0,0 +1,209 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import aiohttp
+from aiohttp import web
+import discord
+from discord import app_commands
+
+# Histogram bucket upper bounds in milliseconds. Every histogram has the same
+# fixed buckets, so memory use doesn't grow with traffic.
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Operation names are commands and wizard steps, so this is never reached in
+# practice; it only stops a bug from growing the table without bound.
+MAX_OPERATIONS = 256
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                break
+        else:
+            i = len(BUCKETS_MS)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += ms
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation (inf for the
+        # overflow bucket)
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else float('inf')
+        return float('inf')
+
+
+class OperationStats:
+    def __init__(self):
+        self.wall = Histogram()
+        self.db = Histogram()
+        self.rest_calls = 0
+        self.ratelimits = 0
+        self.ratelimit_wait = 0.0
+        self.errors = 0
+
+
+class Span:
+    # Costs accumulated by one command or wizard step while it runs
+    def __init__(self, name: str):
+        self.name = name
+        self.db_time = 0.0
+        self.rest_calls = 0
+        self.ratelimits = 0
+        self.ratelimit_wait = 0.0
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('metrics_span', default=None)
+
+
+class Metrics:
+    # In-process telemetry. A span is opened around every app command and
+    # every wizard step; the database and HTTP layers add their costs to
+    # whichever span is current in their task, and the span's totals are
+    # folded into that operation's stats when it ends.
+    def __init__(self):
+        self.operations: Dict[str, OperationStats] = {}
+        self.started = time.time()
+        self.rest_calls = 0
+        self.ratelimits = 0
+        self.caches = {}
+
+    def register_cache(self, name: str, cache):
+        # cache needs hits and misses counters and a len()
+        self.caches[name] = cache
+
+    def _stats(self, name: str) -> OperationStats:
+        stats = self.operations.get(name)
+        if stats is None:
+            if len(self.operations) >= MAX_OPERATIONS:
+                name = 'other'
+            stats = self.operations.setdefault(name, OperationStats())
+        return stats
+
+    @contextmanager
+    def span(self, name: str):
+        span = Span(name)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_span.reset(token)
+            stats = self._stats(name)
+            stats.wall.observe((time.perf_counter() - start) * 1000)
+            stats.db.observe(span.db_time * 1000)
+            stats.rest_calls += span.rest_calls
+            stats.ratelimits += span.ratelimits
+            stats.ratelimit_wait += span.ratelimit_wait
+            stats.errors += failed
+
+    def add_db_time(self, seconds: float):
+        span = _current_span.get()
+        if span is not None:
+            span.db_time += seconds
+
+    def add_rest_call(self, ratelimit_wait: Optional[float] = None):
+        self.rest_calls += 1
+        span = _current_span.get()
+        if span is not None:
+            span.rest_calls += 1
+        if ratelimit_wait is not None:
+            self.ratelimits += 1
+            if span is not None:
+                span.ratelimits += 1
+                span.ratelimit_wait += ratelimit_wait
+
+    def http_trace(self) -> aiohttp.TraceConfig:
+        # Passed to the client as http_trace; discord.py uses the one aiohttp
+        # session for REST and interaction responses, so this sees every call.
+        # Only 429s are visible here, not the waits discord.py takes on its
+        # own before a bucket runs out.
+        async def on_request_end(session, context, params):
+            wait = None
+            if params.response.status == 429:
+                wait = float(params.response.headers.get('Retry-After', 0))
+            self.add_rest_call(wait)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def render_prometheus(self) -> str:
+        lines = [
+            '# TYPE dinobot_rest_calls_total counter',
+            f'dinobot_rest_calls_total {self.rest_calls}',
+            '# TYPE dinobot_ratelimits_total counter',
+            f'dinobot_ratelimits_total {self.ratelimits}',
+        ]
+        for metric, attribute in (('dinobot_operation_seconds', 'wall'), ('dinobot_operation_db_seconds', 'db')):
+            lines.append(f'# TYPE {metric} histogram')
+            for name, stats in sorted(self.operations.items()):
+                histogram = getattr(stats, attribute)
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else f'{bound / 1000:g}'
+                    lines.append(f'{metric}_bucket{{operation="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{operation="{label}"}} {histogram.sum / 1000}')
+                lines.append(f'{metric}_count{{operation="{label}"}} {histogram.count}')
+        for metric, attribute in (('dinobot_operation_rest_calls_total', 'rest_calls'),
+                                  ('dinobot_operation_ratelimits_total', 'ratelimits'),
+                                  ('dinobot_operation_ratelimit_wait_seconds_total', 'ratelimit_wait'),
+                                  ('dinobot_operation_errors_total', 'errors')):
+            lines.append(f'# TYPE {metric} counter')
+            for name, stats in sorted(self.operations.items()):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric}{{operation="{label}"}} {getattr(stats, attribute)}')
+        for metric, kind, value in (('dinobot_cache_hits_total', 'counter', lambda cache: cache.hits),
+                                    ('dinobot_cache_misses_total', 'counter', lambda cache: cache.misses),
+                                    ('dinobot_cache_entries', 'gauge', len)):
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, cache in sorted(self.caches.items()):
+                lines.append(f'{metric}{{cache="{name}"}} {value(cache)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    # Opens a span around each app command (and autocomplete) invocation.
+    # _call is the tree's per-interaction entry point; discord.py runs it in
+    # its own task, so the span covers exactly that command's work.
+    async def _call(self, interaction: discord.Interaction):
+        name = f"/{(interaction.data or {}).get('name', 'unknown')}"
+        if interaction.type is discord.InteractionType.autocomplete:
+            name += ' (autocomplete)'
+        with metrics.span(name):
+            await super()._call(interaction)
+
+
+async def start_metrics_server(host: str, port: int):
+    # Serves render_prometheus() at /metrics; returns the runner to clean up.
+    async def handle(request):
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
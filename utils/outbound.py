@@ -0,0 +1,95 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Hashable, Optional
+
+import discord
+
+
+class OutboundScheduler:
+    # Coordinates the REST calls made after an interaction has been answered.
+    # User-visible calls (followups) go out immediately; cleanup (deleting
+    # finished menus) is queued and only sent once the bot has been idle for
+    # idle_delay seconds, so it never competes with users for discord.py's
+    # rate-limit buckets. A cleanup job waits at most max_delay. Besides
+    # followups, handling an interaction counts as activity (see
+    # user_activity()), since that is where menu steps answer with their
+    # message edits.
+    #
+    # Cleanup jobs are keyed by the message they act on: queuing a second
+    # job for the same message replaces the first, so repeated deletes
+    # collapse into one call.
+    def __init__(self, idle_delay: float = 0.5, max_delay: float = 10.0):
+        self.idle_delay = idle_delay
+        self.max_delay = max_delay
+        self._cleanup: OrderedDict = OrderedDict()
+        self._active = 0
+        self._last_user_call = 0.0
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Pending cleanup is flushed rather than dropped
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        while self._cleanup:
+            _, (_, factory) = self._cleanup.popitem(last=False)
+            await self._run_cleanup(factory)
+
+    @contextmanager
+    def user_activity(self):
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._last_user_call = time.monotonic()
+
+    async def send(self, factory: Callable[[], Awaitable]):
+        with self.user_activity():
+            return await factory()
+
+    async def followup(self, interaction: discord.Interaction, *args, **kwargs):
+        return await self.send(lambda: interaction.followup.send(*args, **kwargs))
+
+    def cleanup(self, key: Hashable, factory: Callable[[], Awaitable]):
+        queued_at = self._cleanup.pop(key, (time.monotonic(), None))[0]
+        self._cleanup[key] = (queued_at, factory)
+        self._wakeup.set()
+
+    def delete_original(self, interaction: discord.Interaction):
+        key = ('message', interaction.message.id) if interaction.message else ('interaction', interaction.id)
+        self.cleanup(key, interaction.delete_original_response)
+
+    async def _run(self):
+        while True:
+            if not self._cleanup:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            queued_at = next(iter(self._cleanup.values()))[0]
+            now = time.monotonic()
+            idle_in = self._last_user_call + self.idle_delay - now
+            overdue_in = queued_at + self.max_delay - now
+            if (self._active or idle_in > 0) and overdue_in > 0:
+                await asyncio.sleep(min(max(idle_in, 0.05), overdue_in))
+                continue
+
+            _, (_, factory) = self._cleanup.popitem(last=False)
+            await self._run_cleanup(factory)
+
+    @staticmethod
+    async def _run_cleanup(factory):
+        try:
+            await factory()
+        except discord.NotFound:
+            pass  # already gone, e.g. the user dismissed the message
+        except Exception as e:
+            print(f"Error running cleanup request: {e}")
@@ -0,0 +1,159 @@
+import asyncio
+from contextlib import contextmanager
+
+POPULATION_QUERY = '''
+    SELECT server_id, dinosaur_id, is_nested, COUNT(*)
+    FROM dino_records
+    GROUP BY server_id, dinosaur_id, is_nested
+'''
+
+
+def count_population_mismatches(conn) -> int:
+    # Number of server_population rows that disagree with dino_records.
+    stored = 'SELECT server_id, dinosaur_id, is_nested, count FROM server_population'
+    return conn.execute(f'''
+        SELECT
+            (SELECT COUNT(*) FROM ({POPULATION_QUERY} EXCEPT {stored}))
+            + (SELECT COUNT(*) FROM ({stored} EXCEPT {POPULATION_QUERY}))
+    ''').fetchone()[0]
+
+
+def rebuild_population_totals(conn) -> int:
+    conn.execute('DELETE FROM server_population')
+    conn.execute(f'''
+        INSERT INTO server_population (server_id, dinosaur_id, is_nested, count)
+        {POPULATION_QUERY}
+    ''')
+    return conn.execute('SELECT COUNT(*) FROM server_population').fetchone()[0]
+
+
+def expire_records(conn, cutoff, batch_size: int):
+    # Moves up to batch_size records last updated before cutoff into the
+    # archive. The delete triggers keep server_population in step; the moved
+    # records' (server_id, dinosaur_id, is_nested) are returned so cached
+    # totals can be patched too.
+    rows = conn.execute('''
+        SELECT id, server_id, dinosaur_id, is_nested
+        FROM dino_records
+        WHERE date_updated < ?
+        ORDER BY date_updated
+        LIMIT ?
+    ''', (cutoff, batch_size)).fetchall()
+    if not rows:
+        return []
+
+    ids = [(row[0],) for row in rows]
+    conn.executemany('''
+        INSERT OR REPLACE INTO dino_records_archive
+        SELECT id, discord_id, account_id, server_id, dinosaur_id, gender_id, is_nested, date_updated
+        FROM dino_records WHERE id = ?
+    ''', ids)
+    conn.executemany('DELETE FROM dino_records WHERE id = ?', ids)
+    return [row[1:] for row in rows]
+
+
+def purge_archive(conn, cutoff, batch_size: int) -> int:
+    return conn.execute('''
+        DELETE FROM dino_records_archive
+        WHERE id IN (
+            SELECT id FROM dino_records_archive
+            WHERE date_updated < ?
+            LIMIT ?
+        )
+    ''', (cutoff, batch_size)).rowcount
+
+
+class PopulationCache:
+    # In-memory per-(game mode, region) dinosaur counts for /server_info,
+    # keyed by server ID and then (dinosaur ID, nested). A region is loaded
+    # from the storage's population totals the first time it is asked for
+    # and afterwards patched in place by apply_change(). Every cached region
+    # has a version that changes whenever its counts do.
+    def __init__(self, storage):
+        self.storage = storage
+        self._regions = {}
+        self._versions = {}
+        self._locks = {}
+        self._generation = 0
+        self._pending_writes = 0
+
+    async def get_region(self, game_mode: str, region: str, server_ids) -> dict:
+        key = (game_mode, region)
+        cached = self._regions.get(key)
+        if cached is not None:
+            return cached
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._regions.get(key)
+            if cached is not None:
+                return cached
+            generation = self._generation
+            pending = self._pending_writes
+            counts = await self.storage.population(server_ids)
+            # A write was in flight or landed while the query ran; serve the
+            # result but don't cache it, since it may or may not include
+            # that write, and apply_change() would then count it twice.
+            if not pending and generation == self._generation:
+                self._regions[key] = counts
+                self._versions[key] = self._generation
+            return counts
+
+    def version(self, game_mode: str, region: str):
+        # None when the region isn't cached
+        return self._versions.get((game_mode, region))
+
+    @contextmanager
+    def writing(self):
+        # Wrap a write and its apply_change() calls in this: until it
+        # exits, regions read from storage aren't cached. (The write may
+        # commit before apply_change() runs, and a read in that gap would
+        # already include it.)
+        self._pending_writes += 1
+        self._generation += 1
+        try:
+            yield
+        finally:
+            self._pending_writes -= 1
+            self._generation += 1
+
+    def apply_change(self, old, new):
+        # old/new are (server_id, dinosaur_id, is_nested) tuples, or None
+        # when a record was created or removed.
+        self._generation += 1
+        if old is not None:
+            self._patch(old, -1)
+        if new is not None:
+            self._patch(new, 1)
+
+    def _patch(self, record, delta):
+        server_id, dinosaur_id, is_nested = record
+        key = (dinosaur_id, int(bool(is_nested)))
+        for region, counts in self._regions.items():
+            if server_id not in counts:
+                continue
+            self._versions[region] = self._generation
+            server_counts = counts[server_id]
+            server_counts[key] += delta
+            if server_counts[key] <= 0:
+                del server_counts[key]
+
+    def invalidate_servers(self, server_ids):
+        # Drops the cached regions holding any of these servers. Used for
+        # changes made by other processes: a region loaded after such a
+        # change already includes it, so patching it would count it twice.
+        self._generation += 1
+        server_ids = set(server_ids)
+        for key in [key for key, counts in self._regions.items() if server_ids & counts.keys()]:
+            del self._regions[key]
+            del self._versions[key]
+
+    def invalidate(self, game_mode: str = None):
+        self._generation += 1
+        if game_mode is None:
+            self._regions.clear()
+            self._versions.clear()
+        else:
+            for key in [key for key in self._regions if key[0] == game_mode]:
+                del self._regions[key]
+                del self._versions[key]
@@ -0,0 +1,52 @@
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import discord
+
+from utils.dispatcher import select_options
+
+
+class RenderCache:
+    # UI pieces that depend only on the catalog and the population totals,
+    # built once and reused by every session: select option lists (shared
+    # between views, which only read them) and /server_info embed payloads
+    # per (game mode, region).
+    #
+    # Everything is tied to catalog_version, and invalidate() moves to a new
+    # one. An embed payload is also tagged with the population version it
+    # was built from and is only served while that version is current.
+    def __init__(self):
+        self.catalog_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._options: Dict[Tuple[Hashable, Optional[str]], List[discord.SelectOption]] = {}
+        self._embeds: Dict[Hashable, Tuple[Hashable, dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._options) + len(self._embeds)
+
+    def options(self, key: Hashable, values: Sequence[str], selected: Optional[str] = None,
+                labels: Optional[dict] = None, descriptions: Optional[dict] = None) -> List[discord.SelectOption]:
+        # key names the catalog list values comes from, e.g. ("servers", mode, region)
+        cached = self._options.get((key, selected))
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        options = self._options[(key, selected)] = select_options(values, selected, labels, descriptions)
+        return options
+
+    def embed(self, key: Hashable, version: Hashable) -> Optional[discord.Embed]:
+        cached = self._embeds.get(key)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return discord.Embed.from_dict(cached[1])
+        self.misses += 1
+        return None
+
+    def store_embed(self, key: Hashable, version: Hashable, embed: discord.Embed):
+        self._embeds[key] = (version, embed.to_dict())
+
+    def invalidate(self):
+        self.catalog_version += 1
+        self._options.clear()
+        self._embeds.clear()
@@ -0,0 +1,389 @@
+import sqlite3
+
+# Ordered schema migrations. The position in the list is the schema version
+# stored in PRAGMA user_version; never edit or reorder an entry that has
+# shipped, append a new one instead.
+MIGRATIONS = [
+    # 1: baseline tables as originally created by the cogs
+    '''
+    CREATE TABLE IF NOT EXISTS user_settings (
+        discord_id INTEGER PRIMARY KEY,
+        alt_accounts_enabled BOOLEAN DEFAULT 0,
+        num_alt_accounts INTEGER DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS alt_accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id INTEGER,
+        account_name TEXT,
+        FOREIGN KEY (discord_id) REFERENCES user_settings (discord_id)
+    );
+    CREATE TABLE IF NOT EXISTS dino_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id INTEGER,
+        account_name TEXT,
+        game_mode TEXT,
+        server TEXT,
+        dinosaur TEXT,
+        gender TEXT,
+        is_nested BOOLEAN,
+        date_updated TIMESTAMP
+    );
+    ''',
+    # 2: one record per (user, account, server) plus indexes for the hot queries
+    '''
+    DELETE FROM dino_records
+    WHERE id NOT IN (
+        SELECT MAX(id) FROM dino_records
+        GROUP BY discord_id, account_name, server
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_dino_records_account_server
+        ON dino_records (discord_id, account_name, server);
+    CREATE INDEX IF NOT EXISTS idx_dino_records_population
+        ON dino_records (game_mode, server, dinosaur, is_nested);
+    CREATE INDEX IF NOT EXISTS idx_dino_records_account_updated
+        ON dino_records (discord_id, account_name, date_updated);
+    CREATE INDEX IF NOT EXISTS idx_alt_accounts_discord_id
+        ON alt_accounts (discord_id);
+    ''',
+    # 3: per-(mode, server, dinosaur, nested) totals kept current by triggers
+    '''
+    CREATE TABLE IF NOT EXISTS server_population (
+        game_mode TEXT NOT NULL,
+        server TEXT NOT NULL,
+        dinosaur TEXT NOT NULL,
+        is_nested INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (game_mode, server, dinosaur, is_nested)
+    ) WITHOUT ROWID;
+    INSERT INTO server_population (game_mode, server, dinosaur, is_nested, count)
+        SELECT game_mode, server, dinosaur, CASE WHEN is_nested THEN 1 ELSE 0 END, COUNT(*)
+        FROM dino_records
+        WHERE game_mode IS NOT NULL AND server IS NOT NULL AND dinosaur IS NOT NULL
+        GROUP BY 1, 2, 3, 4;
+    CREATE TRIGGER IF NOT EXISTS trg_dino_records_population_insert
+    AFTER INSERT ON dino_records
+    BEGIN
+        INSERT INTO server_population (game_mode, server, dinosaur, is_nested, count)
+        VALUES (NEW.game_mode, NEW.server, NEW.dinosaur, CASE WHEN NEW.is_nested THEN 1 ELSE 0 END, 1)
+        ON CONFLICT (game_mode, server, dinosaur, is_nested) DO UPDATE SET count = count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_dino_records_population_delete
+    AFTER DELETE ON dino_records
+    BEGIN
+        UPDATE server_population SET count = count - 1
+        WHERE game_mode = OLD.game_mode AND server = OLD.server AND dinosaur = OLD.dinosaur
+          AND is_nested = CASE WHEN OLD.is_nested THEN 1 ELSE 0 END;
+        DELETE FROM server_population
+        WHERE game_mode = OLD.game_mode AND server = OLD.server AND dinosaur = OLD.dinosaur
+          AND is_nested = CASE WHEN OLD.is_nested THEN 1 ELSE 0 END AND count <= 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_dino_records_population_update
+    AFTER UPDATE OF game_mode, server, dinosaur, is_nested ON dino_records
+    WHEN OLD.game_mode IS NOT NEW.game_mode OR OLD.server IS NOT NEW.server
+      OR OLD.dinosaur IS NOT NEW.dinosaur OR OLD.is_nested IS NOT NEW.is_nested
+    BEGIN
+        UPDATE server_population SET count = count - 1
+        WHERE game_mode = OLD.game_mode AND server = OLD.server AND dinosaur = OLD.dinosaur
+          AND is_nested = CASE WHEN OLD.is_nested THEN 1 ELSE 0 END;
+        DELETE FROM server_population
+        WHERE game_mode = OLD.game_mode AND server = OLD.server AND dinosaur = OLD.dinosaur
+          AND is_nested = CASE WHEN OLD.is_nested THEN 1 ELSE 0 END AND count <= 0;
+        INSERT INTO server_population (game_mode, server, dinosaur, is_nested, count)
+        VALUES (NEW.game_mode, NEW.server, NEW.dinosaur, CASE WHEN NEW.is_nested THEN 1 ELSE 0 END, 1)
+        ON CONFLICT (game_mode, server, dinosaur, is_nested) DO UPDATE SET count = count + 1;
+    END;
+    ''',
+    # 4: state of in-progress wizards and panels, so they survive restarts
+    '''
+    CREATE TABLE IF NOT EXISTS ui_sessions (
+        session_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_ui_sessions_expires_at
+        ON ui_sessions (expires_at);
+    ''',
+    # 5: small key/value store for bot bookkeeping (e.g. command tree hash)
+    '''
+    CREATE TABLE IF NOT EXISTS bot_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID;
+    ''',
+    # 6: catalog lookup tables; dino_records and server_population switch to
+    # integer foreign keys (the game mode is implied by the server)
+    '''
+    CREATE TABLE IF NOT EXISTS game_modes (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS servers (
+        id INTEGER PRIMARY KEY,
+        game_mode_id INTEGER NOT NULL REFERENCES game_modes (id),
+        region TEXT,
+        name TEXT NOT NULL,
+        UNIQUE (game_mode_id, name)
+    );
+    CREATE TABLE IF NOT EXISTS dinosaurs (
+        id INTEGER PRIMARY KEY,
+        dino_type TEXT,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS genders (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS account_names (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+
+    INSERT OR IGNORE INTO game_modes (name)
+        SELECT DISTINCT game_mode FROM dino_records WHERE game_mode IS NOT NULL;
+    INSERT OR IGNORE INTO servers (game_mode_id, name)
+        SELECT DISTINCT game_modes.id, dino_records.server
+        FROM dino_records JOIN game_modes ON game_modes.name = dino_records.game_mode
+        WHERE dino_records.server IS NOT NULL;
+    INSERT OR IGNORE INTO dinosaurs (name)
+        SELECT DISTINCT dinosaur FROM dino_records WHERE dinosaur IS NOT NULL;
+    INSERT OR IGNORE INTO genders (name)
+        SELECT DISTINCT gender FROM dino_records WHERE gender IS NOT NULL;
+    INSERT OR IGNORE INTO account_names (name)
+        SELECT DISTINCT account_name FROM dino_records WHERE account_name IS NOT NULL;
+
+    CREATE TABLE dino_records_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL REFERENCES account_names (id),
+        server_id INTEGER NOT NULL REFERENCES servers (id),
+        dinosaur_id INTEGER NOT NULL REFERENCES dinosaurs (id),
+        gender_id INTEGER REFERENCES genders (id),
+        is_nested INTEGER NOT NULL DEFAULT 0,
+        date_updated TIMESTAMP
+    );
+    INSERT INTO dino_records_new
+        (id, discord_id, account_id, server_id, dinosaur_id, gender_id, is_nested, date_updated)
+        SELECT dino_records.id, dino_records.discord_id, account_names.id, servers.id, dinosaurs.id,
+               genders.id, CASE WHEN dino_records.is_nested THEN 1 ELSE 0 END, dino_records.date_updated
+        FROM dino_records
+        JOIN account_names ON account_names.name = dino_records.account_name
+        JOIN game_modes ON game_modes.name = dino_records.game_mode
+        JOIN servers ON servers.game_mode_id = game_modes.id AND servers.name = dino_records.server
+        JOIN dinosaurs ON dinosaurs.name = dino_records.dinosaur
+        LEFT JOIN genders ON genders.name = dino_records.gender
+        WHERE dino_records.discord_id IS NOT NULL;
+
+    DROP TRIGGER IF EXISTS trg_dino_records_population_insert;
+    DROP TRIGGER IF EXISTS trg_dino_records_population_delete;
+    DROP TRIGGER IF EXISTS trg_dino_records_population_update;
+    DROP TABLE dino_records;
+    ALTER TABLE dino_records_new RENAME TO dino_records;
+
+    CREATE UNIQUE INDEX idx_dino_records_account_server
+        ON dino_records (discord_id, account_id, server_id);
+    CREATE INDEX idx_dino_records_account_updated
+        ON dino_records (discord_id, account_id, date_updated);
+
+    DROP TABLE server_population;
+    CREATE TABLE server_population (
+        server_id INTEGER NOT NULL,
+        dinosaur_id INTEGER NOT NULL,
+        is_nested INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (server_id, dinosaur_id, is_nested)
+    ) WITHOUT ROWID;
+    INSERT INTO server_population (server_id, dinosaur_id, is_nested, count)
+        SELECT server_id, dinosaur_id, is_nested, COUNT(*)
+        FROM dino_records
+        GROUP BY server_id, dinosaur_id, is_nested;
+
+    CREATE TRIGGER trg_dino_records_population_insert
+    AFTER INSERT ON dino_records
+    BEGIN
+        INSERT INTO server_population (server_id, dinosaur_id, is_nested, count)
+        VALUES (NEW.server_id, NEW.dinosaur_id, NEW.is_nested, 1)
+        ON CONFLICT (server_id, dinosaur_id, is_nested) DO UPDATE SET count = count + 1;
+    END;
+    CREATE TRIGGER trg_dino_records_population_delete
+    AFTER DELETE ON dino_records
+    BEGIN
+        UPDATE server_population SET count = count - 1
+        WHERE server_id = OLD.server_id AND dinosaur_id = OLD.dinosaur_id AND is_nested = OLD.is_nested;
+        DELETE FROM server_population
+        WHERE server_id = OLD.server_id AND dinosaur_id = OLD.dinosaur_id AND is_nested = OLD.is_nested
+          AND count <= 0;
+    END;
+    CREATE TRIGGER trg_dino_records_population_update
+    AFTER UPDATE OF server_id, dinosaur_id, is_nested ON dino_records
+    WHEN OLD.server_id IS NOT NEW.server_id OR OLD.dinosaur_id IS NOT NEW.dinosaur_id
+      OR OLD.is_nested IS NOT NEW.is_nested
+    BEGIN
+        UPDATE server_population SET count = count - 1
+        WHERE server_id = OLD.server_id AND dinosaur_id = OLD.dinosaur_id AND is_nested = OLD.is_nested;
+        DELETE FROM server_population
+        WHERE server_id = OLD.server_id AND dinosaur_id = OLD.dinosaur_id AND is_nested = OLD.is_nested
+          AND count <= 0;
+        INSERT INTO server_population (server_id, dinosaur_id, is_nested, count)
+        VALUES (NEW.server_id, NEW.dinosaur_id, NEW.is_nested, 1)
+        ON CONFLICT (server_id, dinosaur_id, is_nested) DO UPDATE SET count = count + 1;
+    END;
+    ''',
+    # 7: index for expiring stale records, and an archive to move them into
+    '''
+    CREATE INDEX IF NOT EXISTS idx_dino_records_date_updated
+        ON dino_records (date_updated);
+    CREATE TABLE IF NOT EXISTS dino_records_archive (
+        id INTEGER PRIMARY KEY,
+        discord_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        server_id INTEGER NOT NULL,
+        dinosaur_id INTEGER NOT NULL,
+        gender_id INTEGER,
+        is_nested INTEGER NOT NULL,
+        date_updated TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_dino_records_archive_date_updated
+        ON dino_records_archive (date_updated);
+    ''',
+    # 8: population history; per-bucket sums of sampled counts at several
+    # resolutions, so finer buckets can be rolled up into coarser ones
+    '''
+    CREATE TABLE IF NOT EXISTS population_history_buckets (
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        PRIMARY KEY (resolution, bucket)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS population_history (
+        resolution INTEGER NOT NULL,
+        server_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        dinosaur_id INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (resolution, server_id, bucket, dinosaur_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_population_history_bucket
+        ON population_history (resolution, bucket);
+    ''',
+    # 9: change notifications between bot processes sharing the database
+    '''
+    CREATE TABLE IF NOT EXISTS cache_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cache_events_created_at
+        ON cache_events (created_at);
+    ''',
+    # 10: archived records are listed in /my_dinos, so keep at most one per
+    # user, account and server across both tables (the newest one)
+    '''
+    DELETE FROM dino_records_archive
+    WHERE EXISTS (
+        SELECT 1 FROM dino_records r
+        WHERE r.discord_id = dino_records_archive.discord_id
+          AND r.account_id = dino_records_archive.account_id
+          AND r.server_id = dino_records_archive.server_id
+    ) OR EXISTS (
+        SELECT 1 FROM dino_records_archive newer
+        WHERE newer.discord_id = dino_records_archive.discord_id
+          AND newer.account_id = dino_records_archive.account_id
+          AND newer.server_id = dino_records_archive.server_id
+          AND (COALESCE(newer.date_updated, ''), newer.id)
+            > (COALESCE(dino_records_archive.date_updated, ''), dino_records_archive.id)
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_dino_records_archive_account_server
+        ON dino_records_archive (discord_id, account_id, server_id);
+    ''',
+    # 11: records from before date_updated was always set get the oldest
+    # possible date, so expiry can range-search the date indexes
+    '''
+    UPDATE dino_records SET date_updated = '1970-01-01 00:00:00' WHERE date_updated IS NULL;
+    UPDATE dino_records_archive SET date_updated = '1970-01-01 00:00:00' WHERE date_updated IS NULL;
+    ''',
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    # Applies every pending migration, each in its own transaction, and
+    # returns the resulting schema version. The version is re-read under the
+    # write lock, so processes starting together never apply one twice.
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            if version >= len(MIGRATIONS):
+                conn.execute('COMMIT')
+                return version
+            migration = MIGRATIONS[version]
+            if callable(migration):
+                migration(conn)
+            else:
+                for statement in _split(migration):
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        print(f'✓ Applied database migration {version + 1}')
+
+
+def incremental_vacuum_enabled(conn: sqlite3.Connection) -> bool:
+    return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    # auto_vacuum can only be switched on for an existing database by a full
+    # VACUUM, so this is done once; afterwards freed pages are returned to
+    # the OS in small steps with PRAGMA incremental_vacuum. The VACUUM
+    # rewrites the whole file under an exclusive lock, so this is an offline
+    # step (see the __main__ block below), never part of bot startup.
+    if incremental_vacuum_enabled(conn):
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def _split(script: str):
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            if statement.strip():
+                yield statement.strip()
+            statement = ''
+
+
+if __name__ == '__main__':
+    # Offline maintenance, run with every bot process stopped:
+    #   python -m utils.schema enable-incremental-vacuum [path]
+    import argparse
+    import os
+    import time
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Offline maintenance for the bot database')
+    parser.add_argument('action', choices=['enable-incremental-vacuum'])
+    parser.add_argument('path', nargs='?', default=os.getenv('DATABASE_PATH', 'dino_tracker.db'))
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.path, isolation_level=None)
+    try:
+        start = time.perf_counter()
+        if enable_incremental_vacuum(conn):
+            print(f'✓ Enabled incremental vacuum on {args.path} ({time.perf_counter() - start:.1f}s)')
+        else:
+            print(f'Incremental vacuum is already enabled on {args.path}')
+    finally:
+        conn.close()
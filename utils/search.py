@@ -0,0 +1,64 @@
+import re
+from typing import Dict, List, Sequence, Set, Tuple
+
+from discord import app_commands
+
+MAX_CHOICES = 25  # Discord's limit for autocomplete results
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+class SearchIndex:
+    # Autocomplete over a fixed list of (label, value) entries. Every prefix
+    # of every word in a label maps to the entries containing it, so a query
+    # is a handful of dict lookups and a set intersection: "eu 2" finds
+    # "EU 2 - Central". Queries no word prefix matches ("carno", "eu2",
+    # "nawest") fall back to matching the query's letters in order.
+    def __init__(self, entries: Sequence[Tuple[str, str]]):
+        self.entries = list(entries)
+        self._compact = [''.join(_words(label)) for label, _ in self.entries]
+        self._prefixes: Dict[str, Set[int]] = {}
+        for i, (label, _) in enumerate(self.entries):
+            for word in _words(label):
+                for end in range(1, len(word) + 1):
+                    self._prefixes.setdefault(word[:end], set()).add(i)
+
+    def search(self, query: str, limit: int = MAX_CHOICES) -> List[Tuple[str, str]]:
+        words = _words(query)
+        if not words:
+            return self.entries[:limit]
+
+        matches = None
+        for word in words:
+            found = self._prefixes.get(word, set())
+            matches = found if matches is None else matches & found
+            if not matches:
+                break
+        if matches:
+            # Labels starting with the query first, then catalog order
+            start = query.strip().lower()
+            ranked = sorted(matches, key=lambda i: (not self.entries[i][0].lower().startswith(start), i))
+        else:
+            compact = ''.join(words)
+            ranked = [i for i, label in enumerate(self._compact) if _in_order(compact, label)]
+        return [self.entries[i] for i in ranked[:limit]]
+
+    def choices(self, query: str) -> List[app_commands.Choice[str]]:
+        return [app_commands.Choice(name=label, value=value) for label, value in self.search(query)]
+
+    def resolve(self, text: str):
+        # Value for text typed without picking a suggestion: an exact value
+        # or label, else the single best match, else None
+        for label, value in self.entries:
+            if text == value or text.lower() == label.lower():
+                return value
+        matches = self.search(text, limit=2)
+        return matches[0][1] if len(matches) == 1 else None
+
+
+def _in_order(needle: str, haystack: str) -> bool:
+    it = iter(haystack)
+    return all(char in it for char in needle)
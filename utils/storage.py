@@ -0,0 +1,301 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.catalog import Catalog, account_id, sync_catalog
+from utils.history import load_trend, record_population_sample, rollup_population_history
+from utils.population import count_population_mismatches, expire_records, purge_archive, rebuild_population_totals
+
+# (server_id, dinosaur_id, is_nested): what a record contributes to the
+# population totals
+PopulationKey = Tuple[int, int, int]
+# (server_id, dinosaur_id, gender_id, is_nested, date_updated, archived)
+Record = Tuple[int, int, Optional[int], int, str, bool]
+
+
+class Storage:
+    # Everything the cogs persist, independent of the engine behind it.
+    # Implementations: SQLiteStorage (the default) and MemoryStorage
+    # (utils/memory_storage.py, for benchmarks and ephemeral runs); both
+    # are checked by tests/test_storage_conformance.py.
+    #
+    # date_updated values are "YYYY-MM-DD HH:MM:SS.ffffff" strings, and
+    # record pages are keyed by [date_updated, id], newest first.
+    #
+    # A user's records include archived ones until they are purged: those
+    # no longer count towards the population but still show in /my_dinos.
+    # Each user, account and server has at most one record, live or
+    # archived; saving that server again brings it back as a live record.
+    async def sync_catalog(self, game_modes, servers_by_mode, dinosaurs, genders) -> Catalog:
+        raise NotImplementedError
+
+    # Dino records
+
+    async def save_record(self, discord_id: int, account_name: str, server_id: int, dinosaur_id: int,
+                          gender_id: int, is_nested: bool) -> Optional[PopulationKey]:
+        # Creates or replaces the user's record for that account and server;
+        # returns what the replaced live record contributed, if there was one.
+        raise NotImplementedError
+
+    async def get_record(self, record_id: int) -> Optional[Record]:
+        raise NotImplementedError
+
+    async def count_records(self, discord_id: int, account_name: str) -> int:
+        raise NotImplementedError
+
+    async def record_page(self, discord_id: int, account_name: str, after: Optional[list],
+                          limit: int) -> List[Tuple[int, str]]:
+        # (id, date_updated) of up to limit records older than the
+        # [date_updated, id] key after, newest first
+        raise NotImplementedError
+
+    async def expire_records(self, cutoff: datetime, limit: int) -> List[PopulationKey]:
+        # Archives up to limit records last updated before cutoff
+        raise NotImplementedError
+
+    async def purge_archive(self, cutoff: datetime, limit: int) -> int:
+        raise NotImplementedError
+
+    async def reclaim_space(self):
+        pass
+
+    # Settings and alt accounts
+
+    async def get_settings(self, discord_id: int) -> Optional[Tuple[bool, int]]:
+        # (alt accounts enabled, number of alt accounts)
+        raise NotImplementedError
+
+    async def set_alt_accounts_enabled(self, discord_id: int, enabled: bool):
+        # Replaces the user's settings, so the alt account count goes back to 0
+        raise NotImplementedError
+
+    async def set_num_alt_accounts(self, discord_id: int, count: int, clear: bool = False):
+        # clear also removes the user's named alt accounts
+        raise NotImplementedError
+
+    async def add_alt_account(self, discord_id: int, name: str):
+        raise NotImplementedError
+
+    async def set_alt_accounts(self, discord_id: int, names: Sequence[str]):
+        # Replaces the user's alt accounts with names (and their count) at once
+        raise NotImplementedError
+
+    async def list_alt_accounts(self, discord_id: int) -> List[str]:
+        raise NotImplementedError
+
+    # Population aggregates
+
+    async def population(self, server_ids: Sequence[int]) -> Dict[int, Counter]:
+        # {server_id: Counter({(dinosaur_id, is_nested): count})}
+        raise NotImplementedError
+
+    async def count_population_mismatches(self) -> int:
+        raise NotImplementedError
+
+    async def rebuild_population(self) -> int:
+        raise NotImplementedError
+
+    async def record_population_sample(self, now: float):
+        raise NotImplementedError
+
+    async def rollup_population_history(self, now: float):
+        raise NotImplementedError
+
+    async def load_trend(self, server_id: int, since: float, step: int):
+        # See utils.history.load_trend
+        raise NotImplementedError
+
+
+class SQLiteStorage(Storage):
+    # Storage on the shared Database connection manager. Population and
+    # alt account changes are published to the event bus (if given) in the
+    # same transaction, so other bot processes can patch their caches.
+    def __init__(self, db, events=None):
+        self.db = db
+        self.events = events
+
+    def _publish(self, conn, topic: str, payload: dict):
+        if self.events is not None:
+            self.events.publish(conn, topic, payload)
+
+    async def sync_catalog(self, game_modes, servers_by_mode, dinosaurs, genders) -> Catalog:
+        return await self.db.transaction(
+            lambda conn: sync_catalog(conn, game_modes, servers_by_mode, dinosaurs, genders)
+        )
+
+    async def save_record(self, discord_id: int, account_name: str, server_id: int, dinosaur_id: int,
+                          gender_id: int, is_nested: bool) -> Optional[PopulationKey]:
+        is_nested = int(is_nested)
+
+        def save(conn):
+            account = account_id(conn, account_name)
+            previous = conn.execute('''
+                SELECT server_id, dinosaur_id, is_nested
+                FROM dino_records
+                WHERE discord_id = ? AND account_id = ? AND server_id = ?
+            ''', (discord_id, account, server_id)).fetchone()
+
+            conn.execute('''
+                INSERT INTO dino_records
+                (discord_id, account_id, server_id, dinosaur_id, gender_id, is_nested, date_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (discord_id, account_id, server_id) DO UPDATE SET
+                    dinosaur_id = excluded.dinosaur_id,
+                    gender_id = excluded.gender_id,
+                    is_nested = excluded.is_nested,
+                    date_updated = excluded.date_updated
+            ''', (discord_id, account, server_id, dinosaur_id, gender_id, is_nested, datetime.now()))
+            conn.execute('''
+                DELETE FROM dino_records_archive
+                WHERE discord_id = ? AND account_id = ? AND server_id = ?
+            ''', (discord_id, account, server_id))
+            self._publish(conn, "population", {"changes": [[previous, (server_id, dinosaur_id, is_nested)]]})
+            return previous
+
+        return await self.db.transaction(save)
+
+    async def get_record(self, record_id: int) -> Optional[Record]:
+        # Archived records keep their ID, and IDs are never reused
+        row = await self.db.fetchone('''
+            SELECT server_id, dinosaur_id, gender_id, is_nested, date_updated, 0
+            FROM dino_records
+            WHERE id = ?
+            UNION ALL
+            SELECT server_id, dinosaur_id, gender_id, is_nested, date_updated, 1
+            FROM dino_records_archive
+            WHERE id = ?
+        ''', (record_id, record_id))
+        return row and (*row[:5], bool(row[5]))
+
+    async def count_records(self, discord_id: int, account_name: str) -> int:
+        row = await self.db.fetchone('''
+            SELECT
+                (SELECT COUNT(*) FROM dino_records
+                 WHERE discord_id = ?1
+                   AND account_id = (SELECT id FROM account_names WHERE name = ?2))
+              + (SELECT COUNT(*) FROM dino_records_archive
+                 WHERE discord_id = ?1
+                   AND account_id = (SELECT id FROM account_names WHERE name = ?2))
+        ''', (discord_id, account_name))
+        return row[0]
+
+    async def record_page(self, discord_id: int, account_name: str, after: Optional[list],
+                          limit: int) -> List[Tuple[int, str]]:
+        # Live and archived records are each read a page at a time through
+        # their (discord_id, account_id, ...) index, then merged
+        keyset = '' if after is None else 'AND (date_updated, id) < (?3, ?4)'
+        page = '''
+            SELECT id, date_updated FROM {table}
+            WHERE discord_id = ?1
+              AND account_id = (SELECT id FROM account_names WHERE name = ?2)
+              {keyset}
+            ORDER BY date_updated DESC, id DESC
+            LIMIT ?5
+        '''
+        return await self.db.fetchall(f'''
+            SELECT * FROM ({page.format(table='dino_records', keyset=keyset)})
+            UNION ALL
+            SELECT * FROM ({page.format(table='dino_records_archive', keyset=keyset)})
+            ORDER BY date_updated DESC, id DESC
+            LIMIT ?5
+        ''', (discord_id, account_name, *(after or (None, None)), limit))
+
+    async def expire_records(self, cutoff: datetime, limit: int) -> List[PopulationKey]:
+        def expire(conn):
+            batch = expire_records(conn, cutoff, limit)
+            if batch:
+                self._publish(conn, "population", {"changes": [[record, None] for record in batch]})
+            return batch
+
+        return await self.db.transaction(expire)
+
+    async def purge_archive(self, cutoff: datetime, limit: int) -> int:
+        return await self.db.transaction(lambda conn: purge_archive(conn, cutoff, limit))
+
+    async def reclaim_space(self, pages: int = 1000):
+        # Returns freed pages to the OS (auto_vacuum is INCREMENTAL)
+        await self.db.run(lambda conn: conn.execute(f'PRAGMA incremental_vacuum({pages})').fetchall())
+
+    async def get_settings(self, discord_id: int) -> Optional[Tuple[bool, int]]:
+        row = await self.db.fetchone('''
+            SELECT alt_accounts_enabled, num_alt_accounts
+            FROM user_settings
+            WHERE discord_id = ?
+        ''', (discord_id,))
+        return row and (bool(row[0]), row[1] or 0)
+
+    async def set_alt_accounts_enabled(self, discord_id: int, enabled: bool):
+        def save(conn):
+            conn.execute('''
+                INSERT OR REPLACE INTO user_settings (discord_id, alt_accounts_enabled)
+                VALUES (?, ?)
+            ''', (discord_id, enabled))
+            self._publish(conn, "accounts", {"discord_id": discord_id})
+
+        await self.db.transaction(save)
+
+    async def set_num_alt_accounts(self, discord_id: int, count: int, clear: bool = False):
+        def save(conn):
+            conn.execute('UPDATE user_settings SET num_alt_accounts = ? WHERE discord_id = ?', (count, discord_id))
+            if clear:
+                conn.execute('DELETE FROM alt_accounts WHERE discord_id = ?', (discord_id,))
+            self._publish(conn, "accounts", {"discord_id": discord_id})
+
+        await self.db.transaction(save)
+
+    async def add_alt_account(self, discord_id: int, name: str):
+        def save(conn):
+            conn.execute('''
+                INSERT INTO alt_accounts (discord_id, account_name)
+                VALUES (?, ?)
+            ''', (discord_id, name))
+            self._publish(conn, "accounts", {"discord_id": discord_id})
+
+        await self.db.transaction(save)
+
+    async def set_alt_accounts(self, discord_id: int, names: Sequence[str]):
+        def save(conn):
+            conn.execute('UPDATE user_settings SET num_alt_accounts = ? WHERE discord_id = ?', (len(names), discord_id))
+            conn.execute('DELETE FROM alt_accounts WHERE discord_id = ?', (discord_id,))
+            conn.executemany('INSERT INTO alt_accounts (discord_id, account_name) VALUES (?, ?)',
+                             [(discord_id, name) for name in names])
+            self._publish(conn, "accounts", {"discord_id": discord_id})
+
+        await self.db.transaction(save)
+
+    async def list_alt_accounts(self, discord_id: int) -> List[str]:
+        rows = await self.db.fetchall('SELECT account_name FROM alt_accounts WHERE discord_id = ?', (discord_id,))
+        return [row[0] for row in rows]
+
+    async def population(self, server_ids: Sequence[int]) -> Dict[int, Counter]:
+        server_ids = list(server_ids)
+        placeholders = ", ".join("?" for _ in server_ids)
+        rows = await self.db.fetchall(f'''
+            SELECT server_id, dinosaur_id, is_nested, count
+            FROM server_population
+            WHERE server_id IN ({placeholders})
+        ''', server_ids)
+
+        counts = {server_id: Counter() for server_id in server_ids}
+        for server_id, dinosaur_id, is_nested, count in rows:
+            counts[server_id][(dinosaur_id, int(bool(is_nested)))] = count
+        return counts
+
+    async def count_population_mismatches(self) -> int:
+        return await self.db.read(count_population_mismatches)
+
+    async def rebuild_population(self) -> int:
+        def rebuild(conn):
+            self._publish(conn, "population", {"invalidate": True})
+            return rebuild_population_totals(conn)
+
+        return await self.db.transaction(rebuild)
+
+    async def record_population_sample(self, now: float):
+        await self.db.transaction(lambda conn: record_population_sample(conn, now))
+
+    async def rollup_population_history(self, now: float):
+        await self.db.transaction(lambda conn: rollup_population_history(conn, now))
+
+    async def load_trend(self, server_id: int, since: float, step: int):
+        return await self.db.read(lambda conn: load_trend(conn, server_id, since, step))